@@ -1,9 +1,19 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 import time
 from datetime import datetime, date, timedelta
+import contextlib
 import os
+import sys
+import functools
+import tempfile
+import threading
+import traceback
+from collections import Counter
+
+import db
+import hintergrund
+import messung
 
 # --- 1. KONFIGURATION & LOGO ---
 LOGO_FILE = "ES_favicon-transparent.png"
@@ -64,166 +74,228 @@ def load_custom_css():
         """, unsafe_allow_html=True)
 
 # --- 3. DATENBANK INIT ---
-DB_NAME = 'zeiterfassung_v2.db'
-
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS buchungen (id INTEGER PRIMARY KEY AUTOINCREMENT, mitarbeiter TEXT, projekt TEXT, aktion TEXT, zeitstempel DATETIME)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, role TEXT, full_name TEXT, department TEXT, job_title TEXT, vacation_days_total INTEGER)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS abwesenheiten (id INTEGER PRIMARY KEY AUTOINCREMENT, mitarbeiter TEXT, start_datum DATE, end_datum DATE, typ TEXT, kommentar TEXT, status TEXT DEFAULT 'Ausstehend', admin_note TEXT)''')
-    
-    # Check ob User existieren
-    c.execute('SELECT count(*) FROM users')
-    if c.fetchone()[0] == 0:
-        users = [
-            ('admin', 'admin123', 'admin', 'Personalabteilung (HR)', 'HR', 'Head of HR', 30),
-            ('max', '1234', 'user', 'Max Mustermann', 'IT', 'Senior Developer', 30),
-            ('erika', '1234', 'user', 'Erika Musterfrau', 'Marketing', 'Content Manager', 28)
-        ]
-        c.executemany('INSERT INTO users VALUES (?,?,?,?,?,?,?)', users)
-        
-        # Demo Buchungen
-        heute = date.today()
-        buchungen = []
-        for i in range(1, 6):
-            tag = heute - timedelta(days=i)
-            if tag.weekday() < 5: 
-                buchungen.append(("Max Mustermann", "Web-Entwicklung", "Kommen", f"{tag} 08:00:00"))
-                buchungen.append(("Max Mustermann", "Web-Entwicklung", "Gehen", f"{tag} 17:00:00"))
-        
-        for item in buchungen:
-            ts = datetime.strptime(item[3], "%Y-%m-%d %H:%M:%S")
-            c.execute('INSERT INTO buchungen (mitarbeiter, projekt, aktion, zeitstempel) VALUES (?, ?, ?, ?)', (item[0], item[1], item[2], ts))
-            
-        next_mon = heute + timedelta(days=10)
-        c.execute("INSERT INTO abwesenheiten (mitarbeiter, start_datum, end_datum, typ, kommentar, status) VALUES (?, ?, ?, ?, ?, ?)",
-                  ("Max Mustermann", next_mon, next_mon + timedelta(days=4), "🌴 Urlaub", "Sommerurlaub bitte!", "Ausstehend"))
-                  
-    conn.commit()
-    conn.close()
+DB_NAME = db.DB_NAME
+# Auswählbare Zeiträume für die Diagramme: Name -> Anzahl Tage bis einschließlich heute
+ZEITRAEUME = {"Woche": 7, "Monat": 30, "Jahr": 365}
+# Urlaub/Krankheit in Arbeitstagen zählen: Wochenenden und Feiertage (ZEIT_FEIERTAGE=2025-12-25,2025-12-26) zählen dann nicht
+NUR_ARBEITSTAGE = os.environ.get('ZEIT_NUR_ARBEITSTAGE') == '1'
+FEIERTAGE = tuple(tag.strip() for tag in os.environ.get('ZEIT_FEIERTAGE', '').split(',') if tag.strip())
+
+# Cockpit-Kennzahlen: neu berechnen, wenn der Snapshot älter als ZEIT_KPI_INTERVALL Sekunden
+# ist oder ZEIT_KPI_NACH_BUCHUNGEN neue Stempel vorliegen
+KPI_INTERVALL = int(os.environ.get('ZEIT_KPI_INTERVALL', 300))
+KPI_NACH_BUCHUNGEN = int(os.environ.get('ZEIT_KPI_NACH_BUCHUNGEN', 50))
+
+@st.cache_resource
+def get_pool():
+    # Ein Pool pro Prozess, geteilt von allen Sessions und Reruns.
+    # Schema/Migrationen laufen damit genau einmal beim ersten Aufruf, nicht bei jedem Rerun.
+    pool = db.VerbindungsPool(DB_NAME)
+    db.init_db(pool)
+    # Demo-Daten nur auf ausdrücklichen Wunsch (sonst: python cli.py seed)
+    if os.environ.get('ZEIT_DEMO_DATEN') == '1':
+        db.demo_daten_anlegen(pool)
+    return pool
+
+@st.cache_resource
+def buchungs_warteschlange():
+    # Stempel aller Sessions in einer Transaktion pro Block (Group Commit)
+    get_pool()
+    return db.BuchungsWarteschlange(DB_NAME)
+
+@st.cache_resource
+def kpi_aktualisierer():
+    # Ein Hintergrund-Thread pro Prozess, gestartet beim ersten Cockpit-Aufruf
+    aktualisierer = hintergrund.KpiAktualisierer(get_pool(), KPI_INTERVALL, KPI_NACH_BUCHUNGEN, NUR_ARBEITSTAGE, FEIERTAGE)
+    aktualisierer.start()
+    return aktualisierer
+
+# --- CACHE ---
+# Lesende Helfer laufen über st.cache_data. Jede schreibende Funktion leert gezielt
+# die Einträge, die sie verändert; die TTL begrenzt nur noch, wie lange Änderungen
+# anderer Prozesse (z.B. cli.py) unsichtbar bleiben können.
+CACHE_TTL = {
+    'users': 600,
+    'buchungen': 300,
+    'abwesenheiten': 300,
+    'cockpit': 60,
+}
+# Prometheus-Textdatei mit Cache-Zählern und Laufzeiten; JSON-Zeilen-Log pro Rerun
+METRIKEN_DATEI = os.environ.get('ZEIT_METRIKEN') or os.environ.get('ZEIT_CACHE_METRIKEN')
+MESS_LOG_DATEI = os.environ.get('ZEIT_MESS_LOG')
+
+@st.cache_resource
+def cache_zaehler():
+    # Prozessweit, überlebt Reruns (Modul-Variablen in app.py würden bei jedem Rerun neu angelegt)
+    return {'lock': threading.Lock(), 'aufrufe': Counter(), 'fehlgriffe': Counter()}
+
+def gecacht(entitaet):
+    """st.cache_data mit der TTL der Entität, Treffer-/Fehlgriff-Zählern und Zeitmessung.
+
+    Argumente immer positionell übergeben, damit .clear(*args) denselben Schlüssel trifft.
+    """
+    def deko(fn):
+        name = fn.__name__
+
+        def laden(*args):
+            zaehler = cache_zaehler()
+            with zaehler['lock']:
+                zaehler['fehlgriffe'][name] += 1
+            messung.ereignis()['cache'] = 'fehlgriff'
+            return fn(*args)
+        # st.cache_data unterscheidet Funktionen über __qualname__ und Quelltext
+        laden.__qualname__ = f"gecacht.{name}"
+        laden = st.cache_data(ttl=CACHE_TTL[entitaet], show_spinner=False)(laden)
+
+        @functools.wraps(fn)
+        def aufruf(*args):
+            zaehler = cache_zaehler()
+            with zaehler['lock']:
+                zaehler['aufrufe'][name] += 1
+            with messung.messen('helfer', name) as e:
+                e['cache'] = 'treffer'
+                ergebnis = laden(*args)
+                e['zeilen'] = messung.zeilen_von(ergebnis)
+            return ergebnis
+        aufruf.clear = laden.clear
+        return aufruf
+    return deko
+
+def cache_metriken_text():
+    """Zähler im Prometheus-Textformat."""
+    zaehler = cache_zaehler()
+    with zaehler['lock']:
+        aufrufe, fehlgriffe = dict(zaehler['aufrufe']), dict(zaehler['fehlgriffe'])
+    zeilen = ["# TYPE zeiterfassung_cache_hits_total counter", "# TYPE zeiterfassung_cache_misses_total counter"]
+    for name in sorted(aufrufe):
+        zeilen.append(f'zeiterfassung_cache_hits_total{{funktion="{name}"}} {aufrufe[name] - fehlgriffe.get(name, 0)}')
+        zeilen.append(f'zeiterfassung_cache_misses_total{{funktion="{name}"}} {fehlgriffe.get(name, 0)}')
+    return "\n".join(zeilen) + "\n"
+
+def metriken_schreiben():
+    # Für den Textfile-Collector des node_exporters: atomar ersetzen. Jede Session schreibt in
+    # eine eigene Temp-Datei im Zielverzeichnis, sonst stören sich gleichzeitige Reruns.
+    if not METRIKEN_DATEI:
+        return
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(METRIKEN_DATEI) or '.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(cache_metriken_text() + messung.SPEICHER.metriken_text())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, METRIKEN_DATEI)
+    except OSError:
+        # Ein fehlgeschlagener Export darf die Seite nicht abbrechen
+        print("Metriken-Export fehlgeschlagen:", file=sys.stderr)
+        traceback.print_exc()
+        if tmp and os.path.exists(tmp):
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
 
 # --- HELFER FUNKTIONEN ---
 
+@gecacht('users')
 def get_all_users_full():
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("SELECT * FROM users WHERE role!='admin'", conn)
-    conn.close()
-    return df
-
-def get_company_stats():
-    conn = sqlite3.connect(DB_NAME)
-    df_b = pd.read_sql_query("SELECT b.*, u.department FROM buchungen b JOIN users u ON b.mitarbeiter = u.full_name", conn)
-    df_a = pd.read_sql_query("SELECT * FROM abwesenheiten", conn)
-    df_u = pd.read_sql_query("SELECT * FROM users WHERE role!='admin'", conn)
-    conn.close()
-    return df_b, df_a, df_u
-
-def get_user_details(fullname):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE full_name=?", (fullname,))
-    u = c.fetchone()
-    conn.close()
-    return u 
+    return db.get_all_users_full(get_pool())
+
+@gecacht('cockpit')
+def lade_kpi_snapshot(snapshot_id):
+    # Snapshots ändern sich nicht; ein neuer bekommt eine neue id und damit einen neuen Cache-Eintrag
+    return db.kpi_snapshot_laden(get_pool(), snapshot_id)
+
+@messung.gemessen()
+def firmen_kennzahlen():
+    """(erstellt, Kennzahlen) des neuesten KPI-Snapshots; nur der allererste wird im Request berechnet."""
+    kpi_aktualisierer()
+    return lade_kpi_snapshot(db.aktueller_kpi_snapshot(get_pool(), NUR_ARBEITSTAGE, FEIERTAGE))
+
+def alter_text(sekunden):
+    if sekunden < 60:
+        return f"{sekunden:.0f} s"
+    if sekunden < 3600:
+        return f"{sekunden / 60:.0f} min"
+    return f"{sekunden / 3600:.1f} h"
 
+@gecacht('users')
+def get_user_details(user_id):
+    return db.get_user_details(get_pool(), user_id)
+
+@messung.gemessen()
 def login_user(username, password):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE username=? AND password=?', (username.lower(), password))
-    user = c.fetchone()
-    conn.close()
-    return user
-
-def buchung_speichern(mitarbeiter, projekt, aktion):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    zeit = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute('INSERT INTO buchungen (mitarbeiter, projekt, aktion, zeitstempel) VALUES (?, ?, ?, ?)', (mitarbeiter, projekt, aktion, zeit))
-    conn.commit()
-    conn.close()
+    return db.login_user(get_pool(), username, password)
+
+@messung.gemessen()
+def buchung_speichern(user_id, projekt, aktion):
+    zeit = datetime.now().replace(microsecond=0)
+    warteschlange = buchungs_warteschlange()
+    if not warteschlange.offen:
+        # Schreib-Thread ist ausgefallen: neu starten, statt jeden Stempel scheitern zu lassen
+        buchungs_warteschlange.clear()
+        warteschlange = buchungs_warteschlange()
+    try:
+        # Wartet auf den Commit des Blocks, danach sind Stempel und tagessaldo gespeichert
+        warteschlange.speichern(user_id, projekt, aktion, zeit)
+    except TimeoutError:
+        # Der Stempel ist weiter eingereiht und wird noch geschrieben; nochmal stempeln wäre doppelt
+        st.warning(f"{aktion} wird noch gespeichert. Bitte nicht erneut stempeln, sondern die Seite gleich neu laden.")
+        return
+    finally:
+        for von in [None] + [zeitraum_von(name) for name in ZEITRAEUME]:
+            lade_tagessalden.clear(user_id, von)
     st.toast(f"✅ {aktion} gespeichert!", icon="💾")
 
-def lade_daten(table, user_role, username):
-    conn = sqlite3.connect(DB_NAME)
-    if user_role == 'admin':
-        df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
-    else:
-        df = pd.read_sql_query(f"SELECT * FROM {table} WHERE mitarbeiter=?", conn, params=(username,))
-    conn.close()
-    return df
-
-def berechne_kpis(df_buchungen, fullname):
-    if df_buchungen.empty: return pd.DataFrame(), 0
-    df = df_buchungen.copy()
-    df['zeitstempel'] = pd.to_datetime(df['zeitstempel'])
-    df['datum'] = df['zeitstempel'].dt.date
-    if fullname != 'all':
-        df = df[df['mitarbeiter'] == fullname]
-    
-    statistik = []
-    saldo_gesamt = 0
-    groupby_cols = ['datum'] if fullname != 'all' else ['datum', 'mitarbeiter']
-    
-    for idx, gruppe in df.groupby(groupby_cols):
-        if fullname == 'all': datum = idx[0]
-        else: datum = idx
-            
-        start = gruppe[gruppe['aktion'] == 'Kommen']['zeitstempel'].min()
-        ende = gruppe[gruppe['aktion'] == 'Gehen']['zeitstempel'].max()
-        stunden = 0.0
-        soll = 8.0
-        if pd.notna(start) and pd.notna(ende):
-            diff = ende - start
-            stunden = diff.total_seconds() / 3600
-        saldo = stunden - soll
-        saldo_gesamt += saldo
-        entry = {"Datum": datum, "Ist": round(stunden, 2), "Soll": soll, "Saldo": round(saldo, 2)}
-        if fullname == 'all': entry['Mitarbeiter'] = idx[1]
-        statistik.append(entry)
-        
-    return pd.DataFrame(statistik), round(saldo_gesamt, 2)
-
-def urlaub_beantragen(mitarbeiter, start, ende, typ, kommentar):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO abwesenheiten (mitarbeiter, start_datum, end_datum, typ, kommentar, status) VALUES (?, ?, ?, ?, ?, 'Ausstehend')", 
-              (mitarbeiter, start, ende, typ, kommentar))
-    conn.commit()
-    conn.close()
+def zeitraum_von(name):
+    return str(date.today() - timedelta(days=ZEITRAEUME[name] - 1))
+
+@gecacht('buchungen')
+def lade_tagessalden(user_id, von):
+    # Nur die Tage ab `von` werden gelesen; der Saldo ist immer der Gesamtsaldo
+    return db.lade_tagessalden(get_pool(), user_id, von)
+
+@gecacht('abwesenheiten')
+def lade_offene_antraege(nach_id, abteilung, typ, von, bis):
+    return db.lade_offene_antraege(get_pool(), nach_id, db.SEITE_ANTRAEGE, abteilung, typ, von, bis)
+
+@gecacht('abwesenheiten')
+def zaehle_offene_antraege(abteilung, typ, von, bis):
+    return db.zaehle_offene_antraege(get_pool(), abteilung, typ, von, bis)
+
+@gecacht('abwesenheiten')
+def lade_eigene_antraege(user_id):
+    return db.lade_eigene_antraege(get_pool(), user_id)
+
+@gecacht('abwesenheiten')
+def get_vacation_stats(user_id, total_days):
+    return db.get_vacation_stats(get_pool(), user_id, total_days, NUR_ARBEITSTAGE, FEIERTAGE)
+
+@gecacht('abwesenheiten')
+def count_sick_days(user_id):
+    return db.count_sick_days(get_pool(), user_id, NUR_ARBEITSTAGE, FEIERTAGE)
+
+def abwesenheiten_cache_leeren(user_id):
+    lade_offene_antraege.clear()
+    zaehle_offene_antraege.clear()
+    lade_eigene_antraege.clear(user_id)
+    # Der Anspruch ist Teil des Schlüssels, daher alle Einträge
+    get_vacation_stats.clear()
+    count_sick_days.clear(user_id)
+    # Urlaubsquote und Krankenstand im Cockpit nicht erst nach dem Intervall nachziehen
+    kpi_aktualisierer().anstossen()
+
+@messung.gemessen()
+def urlaub_beantragen(user_id, start, ende, typ, kommentar):
+    db.urlaub_beantragen(get_pool(), user_id, start, ende, typ, kommentar)
+    abwesenheiten_cache_leeren(user_id)
     st.toast("Antrag gesendet!", icon="📨")
 
-def urlaub_entscheiden(id_val, entscheidung, notiz):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+@messung.gemessen()
+def antraege_entscheiden(antraege, entscheidung):
+    # antraege: Liste von (id, notiz); alle in einer Transaktion
     status = "Genehmigt" if entscheidung == "ok" else "Abgelehnt"
-    c.execute("UPDATE abwesenheiten SET status=?, admin_note=? WHERE id=?", (status, notiz, id_val))
-    conn.commit()
-    conn.close()
-    st.toast(f"Status gesetzt auf: {status}")
-
-def get_vacation_stats(fullname, total_days):
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("SELECT start_datum, end_datum FROM abwesenheiten WHERE mitarbeiter=? AND typ='🌴 Urlaub' AND status='Genehmigt'", conn, params=(fullname,))
-    conn.close()
-    taken = 0
-    for index, row in df.iterrows():
-        d1 = datetime.strptime(row['start_datum'], "%Y-%m-%d")
-        d2 = datetime.strptime(row['end_datum'], "%Y-%m-%d")
-        taken += (d2 - d1).days + 1
-    remaining = total_days - taken
-    return taken, remaining
-
-def count_sick_days(fullname):
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("SELECT start_datum, end_datum FROM abwesenheiten WHERE mitarbeiter=? AND typ='🤒 Krank'", conn, params=(fullname,))
-    conn.close()
-    days = 0
-    for index, row in df.iterrows():
-        d1 = datetime.strptime(row['start_datum'], "%Y-%m-%d")
-        d2 = datetime.strptime(row['end_datum'], "%Y-%m-%d")
-        days += (d2 - d1).days + 1
-    return days
+    betroffene = db.antraege_entscheiden(get_pool(), [(id_val, status, notiz) for id_val, notiz in antraege])
+    for user_id in betroffene:
+        abwesenheiten_cache_leeren(user_id)
+    st.toast(f"{len(antraege)} Anträge: {status}")
 
 # --- UI SEITEN ---
 
@@ -257,6 +329,7 @@ def render_top_bar(user_data=None):
                 st.session_state['logged_in'] = False
                 st.rerun()
 
+@messung.gemessen('ui')
 def login_screen():
     c1, c2, c3 = st.columns([1,2,1])
     with c2:
@@ -275,70 +348,58 @@ def login_screen():
                     st.rerun()
                 else:
                     st.error("Falsch.")
+        if not db.hat_benutzer(get_pool()):
+            st.info("Noch keine Benutzer angelegt. Demo-Daten: `python cli.py seed`")
 
+@messung.gemessen('ui')
 def admin_view():
     st.markdown("#### 👨‍💼 HR Admin Cockpit")
     
-    tab_overview, tab_requests = st.tabs(["📊 Firmen-Dashboard & Mitarbeiter", "📨 Anträge genehmigen"])
+    tab_overview, tab_requests, tab_diagnose = st.tabs(["📊 Firmen-Dashboard & Mitarbeiter", "📨 Anträge genehmigen", "🩺 Diagnose"])
     
     with tab_overview:
         col_list, col_detail = st.columns([1, 3])
         with col_list:
             st.markdown("### Auswahl")
             users_df = get_all_users_full()
-            user_list = users_df['full_name'].tolist()
-            options = ["🏠 FIRMEN-COCKPIT"] + user_list
-            selected_option = st.radio("Ansicht wählen:", options, label_visibility="collapsed")
+            namen = dict(zip(users_df['id'].tolist(), users_df['full_name'].tolist()))
+            options = ["🏠 FIRMEN-COCKPIT"] + list(namen)
+            selected_option = st.radio("Ansicht wählen:", options, format_func=lambda o: namen.get(o, o), label_visibility="collapsed")
         
         with col_detail:
             if selected_option == "🏠 FIRMEN-COCKPIT":
                 st.markdown("## 🚀 Firmen-Übersicht")
-                st.caption("Echtzeit-Daten über die gesamte Belegschaft")
-                
-                df_buchungen, df_absences, df_users = get_company_stats()
-                
-                # Global KPIs
-                if not df_buchungen.empty:
-                    df_buchungen['zeitstempel'] = pd.to_datetime(df_buchungen['zeitstempel'])
-                    stats_all, saldo_all = berechne_kpis(df_buchungen, 'all')
-                    total_hours_worked = stats_all['Ist'].sum() if not stats_all.empty else 0
-                else:
-                    total_hours_worked = 0
-
-                sick_count = 0
-                if not df_absences.empty:
-                    today_str = date.today().strftime("%Y-%m-%d")
-                    sick_df = df_absences[(df_absences['typ'] == '🤒 Krank') & (df_absences['start_datum'] <= today_str) & (df_absences['end_datum'] >= today_str)]
-                    sick_count = len(sick_df)
-
-                total_vac_days_available = df_users['vacation_days_total'].sum()
-                total_vac_taken = 0
-                if not df_absences.empty:
-                    vac_df = df_absences[(df_absences['typ'] == '🌴 Urlaub') & (df_absences['status'] == 'Genehmigt')]
-                    for _, row in vac_df.iterrows():
-                        d1 = datetime.strptime(row['start_datum'], "%Y-%m-%d")
-                        d2 = datetime.strptime(row['end_datum'], "%Y-%m-%d")
-                        total_vac_taken += (d2 - d1).days + 1
-                vac_percentage = (total_vac_taken / total_vac_days_available * 100) if total_vac_days_available > 0 else 0
-                
+                erstellt, stats = firmen_kennzahlen()
+                c_stand, c_knopf = st.columns([4, 1])
+                c_stand.caption(f"Stand {erstellt:%d.%m.%Y %H:%M:%S} (vor {alter_text((datetime.now() - erstellt).total_seconds())}) · "
+                                f"automatisch alle {alter_text(KPI_INTERVALL)} oder nach {KPI_NACH_BUCHUNGEN} Stempeln")
+                if c_knopf.button("🔄 Aktualisieren"):
+                    db.kpi_snapshot_erstellen(get_pool(), NUR_ARBEITSTAGE, FEIERTAGE)
+                    st.rerun()
+
                 k1, k2, k3, k4 = st.columns(4)
-                k1.metric("Gesamtstunden (Ist)", f"{total_hours_worked:.1f} h")
-                k2.metric("Mitarbeiter Krank", f"{sick_count}", delta_color="inverse")
-                k3.metric("Urlaubsquote", f"{vac_percentage:.1f}%")
-                k4.metric("Mitarbeiter", f"{len(df_users)}")
+                k1.metric("Gesamtstunden (Ist)", f"{stats['ist_gesamt']:.1f} h")
+                k2.metric("Mitarbeiter Krank", f"{stats['krank']}", delta_color="inverse")
+                k3.metric("Urlaubsquote", f"{stats['urlaubsquote']:.1f}%")
+                k4.metric("Mitarbeiter", f"{stats['mitarbeiter']}")
                 
                 st.divider()
                 c_chart1, c_chart2 = st.columns(2)
                 with c_chart1:
                     st.markdown("##### 🏢 Stunden pro Abteilung")
-                    if not df_buchungen.empty and 'department' in df_buchungen.columns:
-                        dept_activity = df_buchungen[df_buchungen['aktion']=='Kommen']['department'].value_counts()
-                        st.bar_chart(dept_activity, color="#F63366")
+                    if not stats['abteilungen'].empty:
+                        with messung.messen('chart', 'abteilungen'):
+                            st.bar_chart(stats['abteilungen'], color="#F63366")
                 with c_chart2:
                     st.markdown("##### 📈 Trend")
-                    if not df_buchungen.empty:
-                        daily_hours = stats_all.groupby('Datum')['Ist'].sum()
-                        st.line_chart(daily_hours, color="#FF4B4B")
+                    if not stats['trend'].empty:
+                        with messung.messen('chart', 'trend'):
+                            st.line_chart(stats['trend'], color="#FF4B4B")
+
+                st.markdown("##### 🌴 Urlaub & Krankheit pro Mitarbeiter")
+                st.dataframe(stats['abwesenheiten'].set_index('mitarbeiter').rename(columns={
+                    'urlaub_gesamt': 'Anspruch', 'urlaub_genommen': 'Genommen',
+                    'urlaub_rest': 'Rest', 'krank_tage': 'Krank'}), use_container_width=True)
             else:
                 u_details = get_user_details(selected_option)
                 with st.container():
@@ -348,8 +409,8 @@ def admin_view():
                         st.markdown(f"## {u_details[3]}")
                         st.caption(f"Abteilung: **{u_details[4]}** | Position: **{u_details[5]}**")
                 st.divider()
-                df_b = lade_daten('buchungen', 'admin', 'all')
-                stats_df, saldo = berechne_kpis(df_b, selected_option)
+                zeitraum = st.session_state.get('zeitraum_admin', "Monat")
+                stats_df, saldo = lade_tagessalden(selected_option, zeitraum_von(zeitraum))
                 taken, rest = get_vacation_stats(selected_option, u_details[6])
                 sick = count_sick_days(selected_option)
                 k1, k2, k3, k4 = st.columns(4)
@@ -358,40 +419,114 @@ def admin_view():
                 k3.metric("Urlaub Rest", f"{rest}")
                 k4.metric("Krank", f"{sick}")
                 st.markdown("### 📊 Arbeitszeiten")
+                st.radio("Zeitraum", list(ZEITRAEUME), index=1, key='zeitraum_admin', horizontal=True, label_visibility="collapsed")
                 if not stats_df.empty:
-                    st.bar_chart(stats_df[['Datum', 'Ist', 'Soll']].set_index('Datum'), color=["#F63366", "#333333"])
+                    with messung.messen('chart', 'arbeitszeiten'):
+                        st.bar_chart(stats_df[['Datum', 'Ist', 'Soll']].set_index('Datum'), color=["#F63366", "#333333"])
 
     with tab_requests:
         st.markdown("### Offene Anträge")
-        conn = sqlite3.connect(DB_NAME)
-        df_req = pd.read_sql_query("SELECT * FROM abwesenheiten WHERE status='Ausstehend'", conn)
-        conn.close()
+        f1, f2, f3 = st.columns(3)
+        abteilungen = sorted(get_all_users_full()['department'].dropna().unique().tolist())
+        abteilung = f1.selectbox("Abteilung", ["Alle"] + abteilungen)
+        typ = f2.selectbox("Typ", ["Alle", "🌴 Urlaub", "🤒 Krank", "🏫 Schulung"])
+        zeitraum = f3.date_input("Zeitraum", value=())
+        filter_args = (
+            None if abteilung == "Alle" else abteilung,
+            None if typ == "Alle" else typ,
+            str(zeitraum[0]) if len(zeitraum) > 0 else None,
+            str(zeitraum[1]) if len(zeitraum) > 1 else None,
+        )
+
+        # Seiten als Stapel der jeweils letzten id; neue Filter beginnen wieder bei Seite 1
+        if st.session_state.get('antraege_filter') != filter_args:
+            st.session_state['antraege_filter'] = filter_args
+            st.session_state['antraege_seiten'] = [0]
+        seiten = st.session_state['antraege_seiten']
+
+        gesamt = zaehle_offene_antraege(*filter_args)
+        df_req = lade_offene_antraege(seiten[-1], *filter_args)
         if not df_req.empty:
-            for index, row in df_req.iterrows():
-                with st.container():
-                    c1, c2, c3, c4 = st.columns([2, 2, 2, 2])
-                    c1.markdown(f"**{row['mitarbeiter']}**")
-                    c2.markdown(f"{row['typ']}<br>{row['start_datum']} bis {row['end_datum']}", unsafe_allow_html=True)
-                    c3.markdown(f"📝 *{row['kommentar']}*")
-                    with c4:
-                        notiz = st.text_input("Admin-Notiz", key=f"n_{row['id']}")
-                        cA, cB = st.columns(2)
-                        if cA.button("✅ Genehmigen", key=f"ok_{row['id']}"):
-                            urlaub_entscheiden(row['id'], "ok", notiz); st.rerun()
-                        if cB.button("❌ Ablehnen", key=f"no_{row['id']}"):
-                            urlaub_entscheiden(row['id'], "no", notiz); st.rerun()
-                    st.divider()
+            st.caption(f"Seite {len(seiten)} · {gesamt} offene Anträge")
+            # id als Index: er gehört zur Identität des Editors, so bleiben Häkchen und Notizen
+            # nach einer Entscheidung nicht an den Zeilen hängen, auf die nachgerückte Anträge fallen
+            df_req = df_req.set_index('id')
+            df_req.insert(0, 'auswahl', False)
+            df_req['notiz'] = ""
+            bearbeitet = st.data_editor(
+                df_req, key=f"antraege_{seiten[-1]}_{filter_args}", hide_index=True, use_container_width=True,
+                disabled=['mitarbeiter', 'abteilung', 'typ', 'start_datum', 'end_datum', 'kommentar'],
+                column_config={
+                    'auswahl': st.column_config.CheckboxColumn("✔"),
+                    'mitarbeiter': "Mitarbeiter", 'abteilung': "Abteilung", 'typ': "Typ",
+                    'start_datum': "Von", 'end_datum': "Bis", 'kommentar': "📝 Kommentar",
+                    'notiz': st.column_config.TextColumn("Admin-Notiz"),
+                })
+            auswahl = bearbeitet[bearbeitet['auswahl']]
+            antraege = list(zip(auswahl.index.tolist(), auswahl['notiz'].tolist()))
+
+            cA, cB, cZ, cW = st.columns(4)
+            if cA.button("✅ Auswahl genehmigen", disabled=not antraege):
+                antraege_entscheiden(antraege, "ok"); st.rerun()
+            if cB.button("❌ Auswahl ablehnen", disabled=not antraege):
+                antraege_entscheiden(antraege, "no"); st.rerun()
+            if cZ.button("◀ Zurück", disabled=len(seiten) == 1):
+                seiten.pop(); st.rerun()
+            if cW.button("Weiter ▶", disabled=len(df_req) < db.SEITE_ANTRAEGE):
+                seiten.append(int(df_req.index[-1])); st.rerun()
+        elif len(seiten) > 1:
+            # Seite wurde durch Entscheidungen leer: eine zurück
+            seiten.pop(); st.rerun()
         else:
             st.success("Keine offenen Anträge.")
 
+    with tab_diagnose:
+        diagnose_panel()
+
+def diagnose_panel():
+    """Laufzeiten der letzten Reruns, langsamste Abfragen und cProfile eines einzelnen Reruns (nur Admin)."""
+    letzter = st.session_state.get('letzter_lauf')
+    if letzter:
+        st.markdown(f"##### Letzter Rerun dieser Sitzung: {letzter.dauer * 1000:.1f} ms")
+        st.dataframe(pd.DataFrame([{
+            'Art': e['art'], 'Name': "· " * e['tiefe'] + e['name'], 'Dauer [ms]': e['dauer'] * 1000,
+            'Eigen [ms]': e['eigen'] * 1000, 'Zeilen': e['zeilen'], 'Cache': e.get('cache', ""),
+        } for e in letzter.ereignisse]).round(3), hide_index=True, use_container_width=True)
+
+    laeufe = messung.SPEICHER.letzte_laeufe()
+    if laeufe:
+        st.markdown("##### Letzte Reruns (alle Sitzungen, Eigenzeit pro Art)")
+        st.dataframe(pd.DataFrame([{
+            'Zeit': l.start.strftime('%H:%M:%S'), 'Seite': l.seite, 'Benutzer': l.benutzer,
+            'Gesamt [ms]': l.dauer * 1000, **{f"{art} [ms]": s * 1000 for art, s in l.summen().items()},
+            'Abfragen': sum(e['art'] == 'sql' for e in l.ereignisse),
+        } for l in reversed(laeufe)]).round(2), hide_index=True, use_container_width=True)
+
+    abfragen = messung.SPEICHER.langsamste_abfragen()
+    if abfragen:
+        st.markdown("##### Langsamste Abfragen")
+        st.dataframe(pd.DataFrame(abfragen).round(3), hide_index=True, use_container_width=True)
+
+    st.markdown("##### Profil")
+    if st.button("⏱️ Nächsten Rerun profilieren"):
+        st.session_state['profil_anfordern'] = True
+        st.rerun()
+    profil = st.session_state.get('profil')
+    if profil:
+        st.download_button("📥 rerun.prof", profil['prof'], file_name="rerun.prof")
+        st.code(profil['text'], language=None)
+
+@messung.gemessen('ui')
 def employee_view(user_data):
     fullname = user_data[3]
     vac_total = user_data[6]
+    user_id = user_data[7]
     st.markdown(f"## 👋 Hallo, {fullname}")
     
-    df_b = lade_daten('buchungen', 'user', fullname)
-    stats_df, saldo = berechne_kpis(df_b, fullname)
-    taken, rest = get_vacation_stats(fullname, vac_total)
+    # Nur die Tage des gewählten Zeitraums laden, der Saldo kommt als Summe aus der DB
+    zeitraum = st.session_state.get('zeitraum', "Woche")
+    stats_df, saldo = lade_tagessalden(user_id, zeitraum_von(zeitraum))
+    taken, rest = get_vacation_stats(user_id, vac_total)
     
     k1, k2, k3 = st.columns(3)
     k1.metric("Mein Zeit-Konto", f"{saldo} h", delta="Überstunden / Minusstunden")
@@ -405,13 +540,15 @@ def employee_view(user_data):
         with col_act:
             st.markdown("#### Stempuhr")
             p = st.selectbox("Projekt", ["Web", "Video", "Intern"])
-            if st.button("🟢 KOMMEN", use_container_width=True): buchung_speichern(fullname, p, "Kommen"); st.rerun()
-            if st.button("🔴 GEHEN", use_container_width=True): buchung_speichern(fullname, p, "Gehen"); st.rerun()
-            if st.button("☕ PAUSE", use_container_width=True): buchung_speichern(fullname, p, "Pause"); st.rerun()
+            if st.button("🟢 KOMMEN", use_container_width=True): buchung_speichern(user_id, p, "Kommen"); st.rerun()
+            if st.button("🔴 GEHEN", use_container_width=True): buchung_speichern(user_id, p, "Gehen"); st.rerun()
+            if st.button("☕ PAUSE", use_container_width=True): buchung_speichern(user_id, p, "Pause"); st.rerun()
         with col_chart:
-            st.markdown("#### Meine Woche")
+            st.markdown("#### Meine Zeiten")
+            st.radio("Zeitraum", list(ZEITRAEUME), key='zeitraum', horizontal=True, label_visibility="collapsed")
             if not stats_df.empty:
-                st.bar_chart(stats_df.tail(7)[['Datum', 'Ist', 'Soll']].set_index('Datum'), color=["#F63366", "#333333"])
+                with messung.messen('chart', 'meine_zeiten'):
+                    st.bar_chart(stats_df[['Datum', 'Ist', 'Soll']].set_index('Datum'), color=["#F63366", "#333333"])
 
     with tab_urlaub:
         c_req, c_stat = st.columns(2)
@@ -423,12 +560,10 @@ def employee_view(user_data):
                 d2 = st.date_input("Ende")
                 kom = st.text_area("Grund / Notiz")
                 if st.form_submit_button("Beantragen"):
-                    urlaub_beantragen(fullname, d1, d2, typ, kom); st.rerun()
+                    urlaub_beantragen(user_id, d1, d2, typ, kom); st.rerun()
         with c_stat:
             st.markdown("#### Status")
-            conn = sqlite3.connect(DB_NAME)
-            df_my = pd.read_sql_query("SELECT * FROM abwesenheiten WHERE mitarbeiter=? ORDER BY id DESC", conn, params=(fullname,))
-            conn.close()
+            df_my = lade_eigene_antraege(user_id)
             if not df_my.empty:
                 for i, r in df_my.iterrows():
                     color = "#FFA500" if r['status']=='Ausstehend' else ("#00FF00" if r['status']=='Genehmigt' else "#FF0000")
@@ -439,27 +574,40 @@ def employee_view(user_data):
 # --- MAIN ---
 def main():
     load_custom_css()
-    init_db()
     
     if 'logged_in' not in st.session_state:
         st.session_state['logged_in'] = False
-        
-    if not st.session_state['logged_in']:
-        login_screen()
-    else:
-        # Side Bar anzeigen (Logo + Info)
-        render_sidebar()
-        
-        # NEU: Kopfzeile mit Logo, Titel und Logout
-        user_data = st.session_state['user']
-        render_top_bar(user_data)
-        
-        # Inhalt
-        st.divider()
-        if user_data[2] == 'admin':
-            admin_view()
-        else:
-            employee_view(user_data)
+
+    user_data = st.session_state.get('user') if st.session_state['logged_in'] else None
+    seite = 'login' if not user_data else ('admin' if user_data[2] == 'admin' else 'mitarbeiter')
+    profil = st.session_state.pop('profil_anfordern', False)
+    lauf = None
+    try:
+        with messung.lauf(seite, user_data[0] if user_data else None, MESS_LOG_DATEI, profil) as lauf:
+            if not user_data:
+                login_screen()
+            else:
+                # Side Bar anzeigen (Logo + Info)
+                render_sidebar()
+
+                # NEU: Kopfzeile mit Logo, Titel und Logout
+                render_top_bar(user_data)
+
+                # Inhalt
+                st.divider()
+                if user_data[2] == 'admin':
+                    admin_view()
+                else:
+                    employee_view(user_data)
+    finally:
+        if lauf is not None:
+            st.session_state['letzter_lauf'] = lauf
+            if lauf.profil:
+                st.session_state['profil'] = lauf.profil
+        metriken_schreiben()
+    if lauf.profil:
+        # Profil sofort im Diagnose-Tab zeigen
+        st.rerun()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
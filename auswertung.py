@@ -0,0 +1,186 @@
+"""Auswertungen auf Basis der Stempel-Daten (ohne Streamlit-Abhängigkeit)."""
+import numpy as np
+import pandas as pd
+
+from messung import gemessen
+
+SOLL_STUNDEN = 8.0
+# Längere Schichten gelten als vergessenes Gehen; die Zeit danach zählt nicht
+MAX_SCHICHT_STUNDEN = 24
+TYP_URLAUB = '🌴 Urlaub'
+TYP_KRANK = '🤒 Krank'
+
+
+def namen_kategorisch(user_ids, df_users):
+    """Namen zu user_ids als Categorical (ein String pro Mitarbeiter statt pro Zeile).
+
+    df_users braucht id und full_name. Doppelte Namen werden als "Name (#id)"
+    unterschieden, unbekannte user_ids ergeben NaN.
+    """
+    users = df_users.sort_values('id')
+    ids = users['id'].to_numpy(dtype='int64')
+    namen = users['full_name'].fillna('').astype(str)
+    namen = namen.where(~namen.duplicated(keep=False), namen + ' (#' + users['id'].astype(str) + ')')
+    gesucht = pd.to_numeric(pd.Series(user_ids), errors='coerce').fillna(-1).to_numpy(dtype='int64')
+    pos = np.minimum(np.searchsorted(ids, gesucht), max(len(ids) - 1, 0))
+    gefunden = (ids[pos] == gesucht) if len(ids) else np.zeros(len(gesucht), dtype=bool)
+    return pd.Categorical.from_codes(np.where(gefunden, pos, -1), categories=namen.tolist())
+
+
+def _sortierung(user_ids, sekunden):
+    """Stabile Sortierung nach (user_id, Zeit); ein int64-Schlüssel ist deutlich schneller als lexsort."""
+    if len(user_ids) == 0:
+        return np.arange(0)
+    user_rel, zeit_rel = user_ids - user_ids.min(), sekunden - sekunden.min()
+    if user_rel.max() < 2 ** 16 and (np.diff(sekunden) >= 0).all():
+        # Üblicher Fall (Stempel kommen nach id, also nach Zeit): stabile Sortierung nach
+        # user_id allein reicht, und numpy sortiert 16-Bit-Schlüssel per Radix-Sort in O(n)
+        return np.argsort(user_rel.astype(np.uint16), kind='stable')
+    spanne = int(zeit_rel.max()) + 1
+    if (int(user_rel.max()) + 1) * spanne >= 2 ** 63:
+        return np.lexsort((sekunden, user_ids))
+    return np.argsort(user_rel * spanne + zeit_rel, kind='stable')
+
+
+def _schichten(user, zeit, kommen, gehen, pause):
+    """Tag der Schicht und gezählte Arbeitssekunden pro Stempel; Eingaben nach (user, zeit) sortiert, zeit in Sekunden.
+
+    Kommen beginnt eine Schicht, Gehen beendet sie, jede Pause dazwischen wechselt
+    zwischen Pause und Arbeit. Gezählt wird die Zeit von einem Stempel bis zum nächsten
+    desselben Mitarbeiters, wenn danach gearbeitet wird und der nächste eine Pause oder
+    Gehen ist; ein fehlendes Gehen (nächster Stempel ist Kommen) zählt also nicht,
+    ebenso Zeit nach mehr als MAX_SCHICHT_STUNDEN seit dem Kommen.
+    Die Zeit gehört zum Tag des Kommen, auch wenn die Schicht über Mitternacht geht;
+    Stempel außerhalb einer Schicht oder nach MAX_SCHICHT_STUNDEN gehören zu ihrem
+    Kalendertag. Pro Mitarbeiter ist der Tag damit aufsteigend.
+    """
+    n = len(zeit)
+    neuer_user = np.ones(n, dtype=bool)
+    neuer_user[1:] = user[1:] != user[:-1]
+    # Abschnitt: beginnt bei Kommen, Gehen oder einem neuen Mitarbeiter
+    beginn = kommen | gehen | neuer_user
+    abschnitt = np.cumsum(beginn) - 1
+    start = np.flatnonzero(beginn)
+    in_schicht = kommen[start][abschnitt]
+
+    # Pausen seit Abschnittsbeginn: gerade Anzahl = es wird gearbeitet
+    pausen = np.cumsum(pause)
+    pausen -= (pausen[start] - pause[start])[abschnitt]
+    arbeitet = in_schicht & (pausen % 2 == 0)
+
+    sekunden = np.zeros(n, dtype='int64')
+    kalendertag = zeit // 86400
+    schicht_tag = kalendertag[start][abschnitt]
+    schicht_beginn = zeit[start][abschnitt]
+    # Stempel nach MAX_SCHICHT_STUNDEN gehören nicht mehr zur Schicht, sondern zu ihrem Kalendertag;
+    # so ändert ein Stempel höchstens Vor- und Folgetag (siehe db.tagessalden_aktualisieren)
+    tag = np.where(in_schicht & (zeit - schicht_beginn <= MAX_SCHICHT_STUNDEN * 3600), schicht_tag, kalendertag)
+    if n > 1:
+        innerhalb = zeit[1:] - schicht_beginn[:-1] <= MAX_SCHICHT_STUNDEN * 3600
+        zaehlt = arbeitet[:-1] & ~neuer_user[1:] & (pause[1:] | gehen[1:]) & innerhalb
+        sekunden[:-1] = np.where(zaehlt, zeit[1:] - zeit[:-1], 0)
+        # Gehen gehört zur Schicht, die es beendet
+        beendet = gehen[1:] & ~neuer_user[1:] & in_schicht[:-1] & innerhalb
+        tag[1:] = np.where(beendet, schicht_tag[:-1], tag[1:])
+    return tag, sekunden
+
+
+@gemessen('pandas')
+def tagessalden(df_buchungen):
+    """Ein Eintrag pro (user_id, datum) mit erstem Kommen, letztem Gehen, Ist (ohne Pausen), Soll und Saldo.
+
+    Einmal nach (user_id, Zeit) sortieren, dann Schichten und Tagessummen in einem
+    Durchlauf ohne groupby (siehe _schichten). Eine Spalte mitarbeiter (Name) wird,
+    falls vorhanden, durchgereicht.
+    """
+    df_buchungen = df_buchungen[df_buchungen['user_id'].notna()]
+    user_ids = df_buchungen['user_id'].to_numpy(dtype='int64')
+    sekunden_seit_1970 = pd.to_datetime(df_buchungen['zeitstempel']).to_numpy(dtype='datetime64[s]').astype('int64')
+    reihenfolge = _sortierung(user_ids, sekunden_seit_1970)
+    user, zeit = user_ids[reihenfolge], sekunden_seit_1970[reihenfolge]
+    aktion = df_buchungen['aktion']
+    kommen, gehen, pause = (np.asarray(aktion == name)[reihenfolge] for name in ('Kommen', 'Gehen', 'Pause'))
+    tag, sekunden = _schichten(user, zeit, kommen, gehen, pause)
+
+    neuer_tag = np.ones(len(tag), dtype=bool)
+    neuer_tag[1:] = (user[1:] != user[:-1]) | (tag[1:] != tag[:-1])
+    grenzen = np.flatnonzero(neuer_tag)
+    erste = reihenfolge[grenzen]
+    tage = pd.DataFrame({
+        'user_id': df_buchungen['user_id'].iloc[erste].reset_index(drop=True),
+        'datum': (tag[grenzen] * 86400).astype('datetime64[s]'),
+    })
+    if len(grenzen):
+        kommen_min = np.minimum.reduceat(np.where(kommen, zeit, np.iinfo('int64').max), grenzen)
+        gehen_max = np.maximum.reduceat(np.where(gehen, zeit, np.iinfo('int64').min), grenzen)
+        ist = np.add.reduceat(sekunden, grenzen) / 3600
+    else:
+        kommen_min = gehen_max = np.zeros(0, dtype='int64')
+        ist = np.zeros(0)
+    tage['kommen'] = pd.Series(kommen_min.astype('datetime64[s]')).where(kommen_min != np.iinfo('int64').max)
+    tage['gehen'] = pd.Series(gehen_max.astype('datetime64[s]')).where(gehen_max != np.iinfo('int64').min)
+    if 'mitarbeiter' in df_buchungen:
+        tage['mitarbeiter'] = df_buchungen['mitarbeiter'].iloc[erste].reset_index(drop=True)
+    tage['ist'] = ist
+    tage['soll'] = SOLL_STUNDEN
+    tage['saldo'] = tage['ist'] - tage['soll']
+    return tage
+
+
+@gemessen('pandas')
+def berechne_kpis(df_buchungen, user_id):
+    if df_buchungen.empty: return pd.DataFrame(), 0
+    df = df_buchungen
+    if user_id != 'all':
+        df = df[df['user_id'] == user_id]
+    if df.empty: return pd.DataFrame(), 0
+
+    tage = tagessalden(df)
+    statistik = pd.DataFrame({
+        'Datum': tage['datum'].dt.date,
+        'Ist': tage['ist'].round(2),
+        'Soll': tage['soll'],
+        'Saldo': tage['saldo'].round(2),
+    })
+    if user_id == 'all':
+        statistik['Mitarbeiter'] = tage['mitarbeiter'].astype(str) if 'mitarbeiter' in tage else tage['user_id']
+        statistik = statistik.sort_values(['Datum', 'Mitarbeiter'], kind='stable')
+    return statistik.reset_index(drop=True), round(float(tage['saldo'].sum()), 2)
+
+
+def abwesenheitstage(df_abwesenheiten, nur_arbeitstage=False, feiertage=()):
+    """Tage pro Antrag (start_datum bis end_datum inklusive).
+
+    Mit nur_arbeitstage zählen Wochenenden und die übergebenen Feiertage nicht mit.
+    """
+    start = pd.to_datetime(df_abwesenheiten['start_datum']).to_numpy().astype('datetime64[D]')
+    ende = pd.to_datetime(df_abwesenheiten['end_datum']).to_numpy().astype('datetime64[D]')
+    if nur_arbeitstage:
+        tage = np.busday_count(start, ende + np.timedelta64(1, 'D'), holidays=np.array(feiertage, dtype='datetime64[D]'))
+    else:
+        tage = (ende - start).astype(np.int64) + 1
+    return pd.Series(tage, index=df_abwesenheiten.index, dtype='int64')
+
+
+@gemessen('pandas')
+def abwesenheiten_auswerten(df_abwesenheiten, df_users, nur_arbeitstage=False, feiertage=()):
+    """Urlaub und Krankheit pro Mitarbeiter in einem Durchlauf.
+
+    df_users braucht id, full_name und vacation_days_total; jeder dort aufgeführte
+    Mitarbeiter erscheint im Ergebnis (Index user_id), auch ohne Abwesenheiten.
+    """
+    tage = abwesenheitstage(df_abwesenheiten, nur_arbeitstage, feiertage)
+    urlaub = (df_abwesenheiten['typ'] == TYP_URLAUB) & (df_abwesenheiten['status'] == 'Genehmigt')
+    krank = df_abwesenheiten['typ'] == TYP_KRANK
+    summen = pd.DataFrame({
+        'user_id': df_abwesenheiten['user_id'],
+        'urlaub_genommen': tage.where(urlaub, 0),
+        'krank_tage': tage.where(krank, 0),
+    }).groupby('user_id').sum()
+
+    ergebnis = pd.DataFrame({'urlaub_gesamt': df_users['vacation_days_total'].fillna(0).to_numpy()},
+                            index=pd.Index(df_users['id'], name='user_id'))
+    ergebnis = ergebnis.join(summen, how='left').fillna(0).astype('int64')
+    ergebnis['urlaub_rest'] = ergebnis['urlaub_gesamt'] - ergebnis['urlaub_genommen']
+    ergebnis.insert(0, 'mitarbeiter', namen_kategorisch(ergebnis.index, df_users).astype(str))
+    return ergebnis
@@ -0,0 +1,444 @@
+"""Benchmarks für Auswertungen und Datenbank-Zugriff.
+
+Aufruf:
+    python benchmark.py kpis [--rows 10000 1000000 10000000] [--max-alt 100000]
+    python benchmark.py lesen [--rows 1000000]
+    python benchmark.py lasttest [--clients 200] [--stamps 5]
+    python benchmark.py gruppencommit [--clients 200] [--stamps 5]
+    python benchmark.py queryplan [--db zeiterfassung_v2.db]
+    python benchmark.py rerun [--runs 20]
+    python benchmark.py suite [--mitarbeiter 10 100 1000] [--jahre 1] [--json ergebnis.json] [--vergleich basis.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import db
+import testdaten
+from auswertung import berechne_kpis
+
+
+def berechne_kpis_alt(df_buchungen, fullname):
+    """Bisherige Implementierung (Schleife pro Gruppe) als Vergleichsbasis."""
+    if df_buchungen.empty: return pd.DataFrame(), 0
+    df = df_buchungen.copy()
+    df['zeitstempel'] = pd.to_datetime(df['zeitstempel'])
+    df['datum'] = df['zeitstempel'].dt.date
+    if fullname != 'all':
+        df = df[df['mitarbeiter'] == fullname]
+
+    statistik = []
+    saldo_gesamt = 0
+    groupby_cols = ['datum'] if fullname != 'all' else ['datum', 'mitarbeiter']
+
+    for idx, gruppe in df.groupby(groupby_cols):
+        if fullname == 'all': datum = idx[0]
+        else: datum = idx
+
+        start = gruppe[gruppe['aktion'] == 'Kommen']['zeitstempel'].min()
+        ende = gruppe[gruppe['aktion'] == 'Gehen']['zeitstempel'].max()
+        stunden = 0.0
+        soll = 8.0
+        if pd.notna(start) and pd.notna(ende):
+            diff = ende - start
+            stunden = diff.total_seconds() / 3600
+        saldo = stunden - soll
+        saldo_gesamt += saldo
+        entry = {"Datum": datum, "Ist": round(stunden, 2), "Soll": soll, "Saldo": round(saldo, 2)}
+        if fullname == 'all': entry['Mitarbeiter'] = idx[1]
+        statistik.append(entry)
+
+    return pd.DataFrame(statistik), round(saldo_gesamt, 2)
+
+
+def synthetische_buchungen(n_rows, n_mitarbeiter=400, seed=42, pausen=False):
+    """Erzeugt Kommen/Gehen-Paare für n_mitarbeiter über so viele Tage wie nötig.
+
+    Mit pausen hat jede Schicht zusätzlich eine Pause (zwei Pause-Stempel), die Zeilenzahl bleibt gleich.
+    """
+    rng = np.random.default_rng(seed)
+    n_paare = max(n_rows // (4 if pausen else 2), 1)
+    idx = np.arange(n_paare)
+    mitarbeiter = idx % n_mitarbeiter
+    tag = idx // n_mitarbeiter
+    start = np.datetime64('2020-01-01', 's') + tag * np.timedelta64(1, 'D')
+    kommen = start + rng.integers(7 * 3600, 10 * 3600, n_paare).astype('timedelta64[s]')
+    gehen = kommen + rng.integers(6 * 3600, 10 * 3600, n_paare).astype('timedelta64[s]')
+    aktionen, zeiten = ['Kommen', 'Gehen'], [kommen, gehen]
+    if pausen:
+        pause = kommen + rng.integers(3 * 3600, 5 * 3600, n_paare).astype('timedelta64[s]')
+        aktionen, zeiten = ['Kommen', 'Pause', 'Pause', 'Gehen'], [kommen, pause, pause + np.timedelta64(30 * 60, 's'), gehen + np.timedelta64(30 * 60, 's')]
+    namen = pd.Categorical([f"Mitarbeiter {i:04d}" for i in range(n_mitarbeiter)])
+    user_ids = np.tile(mitarbeiter, len(aktionen)) + 1
+    return pd.DataFrame({
+        'id': np.arange(len(user_ids)),
+        'user_id': user_ids,
+        'mitarbeiter': namen[user_ids - 1],
+        'projekt': 'Web',
+        'aktion': np.repeat(np.array(aktionen, dtype=object), n_paare),
+        'zeitstempel': np.concatenate(zeiten),
+    })
+
+
+def messen(fn, *args):
+    t0 = time.perf_counter()
+    ergebnis = fn(*args)
+    return time.perf_counter() - t0, ergebnis
+
+
+def bench_kpis(rows, max_alt):
+    """berechne_kpis alt gegen neu auf Daten ohne Pausen, dazu neu mit Pausen (Gleichheit prüft tests/test_auswertung.py)."""
+    print(f"{'Zeilen':>12} {'alt [s]':>10} {'neu [s]':>10} {'Faktor':>8} {'mit Pausen [s]':>15}")
+    for n in rows:
+        df = synthetische_buchungen(n)
+        t_neu, _ = messen(berechne_kpis, df, 'all')
+        t_pausen, _ = messen(berechne_kpis, synthetische_buchungen(n, pausen=True), 'all')
+        if n <= max_alt:
+            t_alt, _ = messen(berechne_kpis_alt, df, 'all')
+            print(f"{n:>12} {t_alt:>10.3f} {t_neu:>10.3f} {t_alt / t_neu:>7.1f}x {t_pausen:>15.3f}")
+        else:
+            print(f"{n:>12} {'-':>10} {t_neu:>10.3f} {'-':>8} {t_pausen:>15.3f}")
+
+
+def bench_lesen(rows):
+    """Lesepfad buchungen: Text-Zeitstempel mit to_datetime gegen INTEGER-Sekunden mit astype."""
+    df = synthetische_buchungen(rows)[['user_id', 'aktion', 'zeitstempel']]
+    sekunden = df['zeitstempel'].to_numpy().astype('datetime64[s]').astype('int64')
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'lesen.db'))
+        conn.execute("CREATE TABLE text (user_id INTEGER, aktion TEXT, zeitstempel DATETIME)")
+        conn.execute("CREATE TABLE epoch (user_id INTEGER, aktion TEXT, zeitstempel INTEGER)")
+        conn.executemany("INSERT INTO text VALUES (?, ?, ?)", zip(df['user_id'].tolist(), df['aktion'].tolist(), df['zeitstempel'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist()))
+        conn.executemany("INSERT INTO epoch VALUES (?, ?, ?)", zip(df['user_id'].tolist(), df['aktion'].tolist(), sekunden.tolist()))
+        conn.commit()
+
+        t_lesen_text, d_text = messen(pd.read_sql_query, "SELECT * FROM text", conn)
+        t_lesen_epoch, d_epoch = messen(pd.read_sql_query, "SELECT * FROM epoch", conn)
+        conn.close()
+    t_text, d_text['zeitstempel'] = messen(pd.to_datetime, d_text['zeitstempel'])
+    t_epoch, d_epoch = messen(db.zeiten_umwandeln, d_epoch, 'buchungen')
+    assert (d_text['zeitstempel'].to_numpy() == d_epoch['zeitstempel'].to_numpy()).all()
+    print(f"{'':>12} {'lesen [s]':>10} {'umwandeln [s]':>14} {'gesamt [s]':>11}")
+    print(f"{'Text':>12} {t_lesen_text:>10.3f} {t_text:>14.4f} {t_lesen_text + t_text:>11.3f}")
+    print(f"{'Epoch':>12} {t_lesen_epoch:>10.3f} {t_epoch:>14.4f} {t_lesen_epoch + t_epoch:>11.3f}")
+
+def buchung_einzeln(db_name, user_id):
+    """Bisheriger Schreibpfad: eigene Verbindung pro Stempel."""
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    zeit = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    c.execute(db.SQL_BUCHUNG_NEU, (user_id, "Web", "Kommen", zeit))
+    conn.commit()
+    conn.close()
+
+
+def lasttest_lauf(clients, stamps, schreiben, latenzen=None):
+    """Startet `clients` Threads gleichzeitig, jeder stempelt `stamps` mal.
+
+    Mit einer Liste `latenzen` wird dort die Dauer jedes Stempels bis zur Bestätigung gesammelt.
+    """
+    start = threading.Barrier(clients)
+    fehler = []
+
+    def client(nr):
+        start.wait()
+        for _ in range(stamps):
+            t0 = time.perf_counter()
+            try:
+                schreiben(nr + 1)
+            except sqlite3.OperationalError as e:
+                fehler.append(str(e))
+            if latenzen is not None:
+                latenzen.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return time.perf_counter() - t0, fehler
+
+
+def bench_lasttest(clients, stamps):
+    print(f"{'Variante':>10} {'Dauer [s]':>10} {'Stempel/s':>10} {'Fehler':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Alt: Standard-Journal, connect-per-call
+        db_alt = os.path.join(tmp, 'alt.db')
+        conn = sqlite3.connect(db_alt)
+        conn.execute("CREATE TABLE buchungen (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, projekt TEXT, aktion TEXT, zeitstempel DATETIME)")
+        conn.close()
+        dauer, fehler = lasttest_lauf(clients, stamps, lambda ma: buchung_einzeln(db_alt, ma))
+        ok = clients * stamps - len(fehler)
+        print(f"{'einzeln':>10} {dauer:>10.3f} {ok / dauer:>10.0f} {len(fehler):>8}")
+
+        # Neu: WAL + gemeinsamer Pool
+        pool = db.VerbindungsPool(os.path.join(tmp, 'pool.db'))
+        db.init_db(pool)
+        zeit = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        dauer, fehler = lasttest_lauf(clients, stamps, lambda ma: db.buchung_speichern(pool, ma, "Web", "Kommen", zeit))
+        ok = clients * stamps - len(fehler)
+        print(f"{'pool':>10} {dauer:>10.3f} {ok / dauer:>10.0f} {len(fehler):>8}")
+        pool.schliessen()
+
+
+def bench_gruppencommit(clients, stamps):
+    """Commit pro Stempel (Pool, synchronous NORMAL/FULL) gegen die BuchungsWarteschlange (Group Commit, FULL)."""
+    print(f"{'Variante':>16} {'Dauer [s]':>10} {'Stempel/s':>10} {'p50 [ms]':>9} {'p99 [ms]':>9} {'Blöcke':>7} {'Fehler':>7}")
+    zeit = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with tempfile.TemporaryDirectory() as tmp:
+        varianten = []
+        for synchronous in ('NORMAL', 'FULL'):
+            pool = db.VerbindungsPool(os.path.join(tmp, f'einzeln_{synchronous}.db'), synchronous=synchronous)
+            db.init_db(pool)
+            varianten.append((f"einzeln {synchronous}", lambda ma, pool=pool: db.buchung_speichern(pool, ma, "Web", "Kommen", zeit), pool.schliessen, None))
+        pfad = os.path.join(tmp, 'gruppe.db')
+        pool = db.VerbindungsPool(pfad)
+        db.init_db(pool)
+        pool.schliessen()
+        warteschlange = db.BuchungsWarteschlange(pfad)
+        varianten.append(("Gruppe FULL", lambda ma: warteschlange.speichern(ma, "Web", "Kommen", zeit), warteschlange.schliessen, warteschlange))
+
+        for name, schreiben, schliessen, ws in varianten:
+            latenzen = []
+            dauer, fehler = lasttest_lauf(clients, stamps, schreiben, latenzen)
+            schliessen()
+            ok = clients * stamps - len(fehler)
+            bloecke = ws.bloecke if ws else ok
+            print(f"{name:>16} {dauer:>10.3f} {ok / dauer:>10.0f} {np.percentile(latenzen, 50) * 1000:>9.1f} "
+                  f"{np.percentile(latenzen, 99) * 1000:>9.1f} {bloecke:>7} {len(fehler):>7}")
+
+
+def bench_queryplan(db_name):
+    """Prüft per EXPLAIN QUERY PLAN, dass die Hot-Path-Abfragen Indizes nutzen."""
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = db.VerbindungsPool(db_name or os.path.join(tmp, 'plan.db'))
+        db.init_db(pool)
+        with pool.verbindung() as conn:
+            for name, (sql, params) in db.HOT_QUERIES.items():
+                print(f"{name}: {' | '.join(db.query_plan(conn, sql, params))}")
+            scans = db.pruefe_query_plaene(conn)
+        pool.schliessen()
+    for name in scans:
+        print(f"FEHLER: {name} scannt die ganze Tabelle")
+    return 1 if scans else 0
+
+
+def init_db_alt(db_name):
+    """Bisheriger Bootstrap, der bei jedem Rerun lief."""
+    conn = sqlite3.connect(db_name)
+    c = conn.cursor()
+    c.execute(db.MIGRATIONEN[0][0])
+    c.execute(db.MIGRATIONEN[0][1])
+    c.execute(db.MIGRATIONEN[0][2])
+    c.execute('SELECT count(*) FROM users')
+    c.fetchone()
+    conn.commit()
+    conn.close()
+
+
+def bench_rerun(runs):
+    """Misst die Dauer eines Streamlit-Reruns (Mitarbeiter-Ansicht) über AppTest."""
+    from streamlit.testing.v1 import AppTest
+
+    app_pfad = os.path.abspath(os.path.join(os.path.dirname(__file__), 'app.py'))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            pool = db.VerbindungsPool(db.DB_NAME)
+            db.init_db(pool)
+            db.demo_daten_anlegen(pool)
+            pool.schliessen()
+
+            t_alt = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                init_db_alt(db.DB_NAME)
+                t_alt.append(time.perf_counter() - t0)
+
+            at = AppTest.from_file(app_pfad, default_timeout=60)
+            at.run()
+            at.text_input[0].input('max')
+            at.text_input[1].input('1234')
+            at.button[0].click()
+            at.run()
+            zeiten = []
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                at.run()
+                zeiten.append(time.perf_counter() - t0)
+        finally:
+            os.chdir(cwd)
+    print(f"Bootstrap alt (pro Rerun):    {np.median(t_alt) * 1000:8.2f} ms (Median)")
+    print(f"Rerun Mitarbeiter-Ansicht:   {np.median(zeiten) * 1000:8.2f} ms (Median, p95 {np.percentile(zeiten, 95) * 1000:.2f} ms)")
+
+
+def suite_messungen(pool):
+    """Messpunkte {Name: Funktion} für eine Firma; jeweils ohne Streamlit-Cache, also der Weg eines Cache-Fehlgriffs.
+
+    Cockpit und Mitarbeiter rufen dieselben db-Funktionen auf, die app.py hinter seinen gecacht-Helfern nutzt.
+    """
+    df = db.lade_daten(pool, 'buchungen', 'admin', 'all')
+    user_id = int(db.get_all_users_full(pool)['id'].iloc[0])
+    woche, monat = (str(date.today() - timedelta(days=tage - 1)) for tage in (7, 30))
+    db.kpi_snapshot_erstellen(pool)
+
+    def cockpit():
+        db.kpi_snapshot_laden(pool, db.aktueller_kpi_snapshot(pool))
+        db.get_all_users_full(pool)
+        db.zaehle_offene_antraege(pool)
+        db.lade_offene_antraege(pool)
+
+    def mitarbeiter():
+        details = db.get_user_details(pool, user_id)
+        db.lade_tagessalden(pool, user_id, woche)
+        db.get_vacation_stats(pool, user_id, details[6])
+        db.lade_eigene_antraege(pool, user_id)
+
+    def admin_detail():
+        details = db.get_user_details(pool, user_id)
+        db.lade_tagessalden(pool, user_id, monat)
+        db.get_vacation_stats(pool, user_id, details[6])
+        db.count_sick_days(pool, user_id)
+
+    return {
+        'berechne_kpis (alle)': lambda: berechne_kpis(df, 'all'),
+        'berechne_kpis (mitarbeiter)': lambda: berechne_kpis(df, user_id),
+        'lade_daten (alle)': lambda: db.lade_daten(pool, 'buchungen', 'admin', 'all'),
+        'get_company_stats': lambda: db.get_company_stats(pool),
+        'get_vacation_stats': lambda: db.get_vacation_stats(pool, user_id, 30),
+        'cockpit': cockpit,
+        'cockpit (snapshot erstellen)': lambda: db.kpi_snapshot_erstellen(pool),
+        'mitarbeiter': mitarbeiter,
+        'mitarbeiter (admin-detail)': admin_detail,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def suite_vergleichen(ergebnis, basis, toleranz):
+    """Median neu/alt je (Mitarbeiter, Messung); gibt die Zahl der Verschlechterungen über `toleranz` zurück."""
+    alt = {(e['mitarbeiter'], e['messung']): e for e in basis['ergebnisse']}
+    print(f"\nVergleich mit {basis.get('commit') or '?'} ({basis.get('zeit', '?')}):")
+    print(f"{'Mitarbeiter':>11} {'Messung':<30} {'alt [ms]':>10} {'neu [ms]':>10} {'Faktor':>7}")
+    langsamer = 0
+    for e in ergebnis['ergebnisse']:
+        a = alt.get((e['mitarbeiter'], e['messung']))
+        if a is None:
+            continue
+        faktor = e['median_ms'] / a['median_ms'] if a['median_ms'] else float('inf')
+        markierung = ""
+        if faktor > 1 + toleranz:
+            langsamer += 1
+            markierung = "  LANGSAMER"
+        print(f"{e['mitarbeiter']:>11} {e['messung']:<30} {a['median_ms']:>10.2f} {e['median_ms']:>10.2f} {faktor:>6.2f}x{markierung}")
+    return langsamer
+
+
+def bench_suite(skalen, jahre, wiederholungen, json_datei, vergleich, toleranz):
+    """Berechnungen und Seitenpfade gegen synthetische Firmen verschiedener Größe; Ergebnis optional als JSON."""
+    ergebnis = {
+        'commit': git_commit(),
+        'zeit': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'jahre': jahre,
+        'wiederholungen': wiederholungen,
+        'firmen': [],
+        'ergebnisse': [],
+    }
+    print(f"{'Mitarbeiter':>11} {'Messung':<30} {'min [ms]':>10} {'Median [ms]':>12} {'p95 [ms]':>10}")
+    for n in skalen:
+        t0 = time.perf_counter()
+        with testdaten.temporaere_firma(testdaten.abteilungen_verteilen(n), jahre=jahre) as (pool, info):
+            info['anlegen_s'] = round(time.perf_counter() - t0, 3)
+            ergebnis['firmen'].append(info)
+            print(f"{'':>11} Firma: {info['buchungen']} Buchungen, {info['abwesenheiten']} Abwesenheiten, "
+                  f"{info['tagessalden']} Tagessalden ({info['anlegen_s']:.1f} s)")
+            for name, fn in suite_messungen(pool).items():
+                zeiten = []
+                for _ in range(wiederholungen):
+                    dauer, _ = messen(fn)
+                    zeiten.append(dauer * 1000)
+                zeile = {'mitarbeiter': info['mitarbeiter'], 'buchungen': info['buchungen'], 'messung': name,
+                         'min_ms': round(min(zeiten), 3), 'median_ms': round(float(np.median(zeiten)), 3),
+                         'p95_ms': round(float(np.percentile(zeiten, 95)), 3)}
+                ergebnis['ergebnisse'].append(zeile)
+                print(f"{zeile['mitarbeiter']:>11} {name:<30} {zeile['min_ms']:>10.2f} {zeile['median_ms']:>12.2f} {zeile['p95_ms']:>10.2f}")
+    if json_datei:
+        with open(json_datei, 'w', encoding='utf-8') as f:
+            json.dump(ergebnis, f, ensure_ascii=False, indent=2)
+        print(f"Ergebnis in {json_datei}")
+    if vergleich:
+        with open(vergleich, encoding='utf-8') as f:
+            return 1 if suite_vergleichen(ergebnis, json.load(f), toleranz) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='befehl', required=True)
+
+    p = sub.add_parser('kpis', help="berechne_kpis alt gegen neu")
+    p.add_argument('--rows', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    p.add_argument('--max-alt', type=int, default=100_000,
+                   help="Alte Implementierung nur bis zu dieser Zeilenzahl messen (sie skaliert schlecht).")
+
+    p = sub.add_parser('lesen', help="Lesen + Umwandeln der Zeitstempel: Text gegen INTEGER")
+    p.add_argument('--rows', type=int, default=1_000_000)
+
+    p = sub.add_parser('lasttest', help="Gleichzeitiges Stempeln gegen eine temporäre DB")
+    p.add_argument('--clients', type=int, default=200)
+    p.add_argument('--stamps', type=int, default=5)
+
+    p = sub.add_parser('gruppencommit', help="Commit pro Stempel gegen Group Commit über die Warteschlange")
+    p.add_argument('--clients', type=int, default=200)
+    p.add_argument('--stamps', type=int, default=5)
+
+    p = sub.add_parser('queryplan', help="Index-Nutzung der Hot-Path-Abfragen prüfen")
+    p.add_argument('--db', help="Bestehende Datenbank prüfen (wird dabei migriert); Standard: temporäre DB")
+
+    p = sub.add_parser('rerun', help="Rerun-Latenz der App messen")
+    p.add_argument('--runs', type=int, default=20)
+
+    p = sub.add_parser('suite', help="Synthetische Firmen erzeugen und Berechnungen/Seitenpfade messen")
+    p.add_argument('--mitarbeiter', type=int, nargs='+', default=[10, 100, 1000])
+    p.add_argument('--jahre', type=int, default=1)
+    p.add_argument('--wiederholungen', type=int, default=5)
+    p.add_argument('--json', help="Ergebnis als JSON speichern (z.B. pro Commit)")
+    p.add_argument('--vergleich', help="Früheres JSON-Ergebnis; Exit-Code 1 bei Verschlechterung")
+    p.add_argument('--toleranz', type=float, default=0.2, help="Erlaubte Verschlechterung des Medians (0.2 = 20%%)")
+
+    args = parser.parse_args()
+    if args.befehl == 'kpis':
+        bench_kpis(args.rows, args.max_alt)
+    elif args.befehl == 'lesen':
+        bench_lesen(args.rows)
+    elif args.befehl == 'lasttest':
+        bench_lasttest(args.clients, args.stamps)
+    elif args.befehl == 'gruppencommit':
+        bench_gruppencommit(args.clients, args.stamps)
+    elif args.befehl == 'queryplan':
+        sys.exit(bench_queryplan(args.db))
+    elif args.befehl == 'rerun':
+        bench_rerun(args.runs)
+    elif args.befehl == 'suite':
+        sys.exit(bench_suite(args.mitarbeiter, args.jahre, args.wiederholungen, args.json, args.vergleich, args.toleranz))
@@ -0,0 +1,323 @@
+"""Verwaltungs-Befehle für die Zeiterfassungs-Datenbank.
+
+Aufruf:
+    python cli.py [--db zeiterfassung_v2.db] init    Schema anlegen / migrieren
+    python cli.py [--db zeiterfassung_v2.db] seed    Demo-Benutzer und -Buchungen anlegen
+    python cli.py [--db zeiterfassung_v2.db] rebuild-tagessaldo
+                                                     Tagessalden komplett aus buchungen neu berechnen
+    python cli.py [--db ...] kpi-snapshot [--nur-arbeitstage] [--feiertage 2025-12-25,2025-12-26]
+                                                     Cockpit-Kennzahlen neu berechnen (z.B. per cron,
+                                                     wenn kein App-Prozess dauerhaft läuft)
+    python cli.py [--db ...] testdaten [--mitarbeiter 200] [--jahre 1] [--seed 42]
+                                                     Synthetische Firma in eine DB ohne Benutzer schreiben
+    python cli.py [--db ...] export buchungen export.parquet [--von 2025-01-01 --bis 2025-01-31]
+    python cli.py [--db ...] import buchungen altsystem.csv
+
+Export und Import arbeiten in Blöcken (--chunk Zeilen) und brauchen daher auch bei
+sehr großen Tabellen nur wenig Speicher. Parquet benötigt pyarrow (kommt mit streamlit).
+Zeitpunkte stehen in CSV als 'YYYY-MM-DD HH:MM:SS', in Parquet als Timestamp.
+Exporte enthalten neben user_id den Namen (mitarbeiter). Importe brauchen eine der
+beiden Spalten. Eine user_id wird nur übernommen, wenn es sie in der Ziel-Datenbank
+gibt und (falls vorhanden) der Name passt; sonst gilt der Name. Namen ohne Benutzer
+werden als inaktive Benutzer angelegt, unbekannte user_ids ohne Namen brechen den
+Import ab. Leere Zellen werden NULL, außer bei Spalten mit Standardwert (status).
+"""
+import argparse
+import csv
+import itertools
+import sys
+import time
+from datetime import date, datetime
+
+import db
+import testdaten
+
+CHUNK = 50_000
+FORTSCHRITT_ALLE = 1_000_000
+
+# Spalten, die beim Import übernommen werden (id vergibt die Datenbank neu);
+# user_id und mitarbeiter (Name) werden zu einer user_id der Ziel-Datenbank
+IMPORT_SPALTEN = {
+    'buchungen': ['user_id', 'mitarbeiter', 'projekt', 'aktion', 'zeitstempel'],
+    'abwesenheiten': ['user_id', 'mitarbeiter', 'start_datum', 'end_datum', 'typ', 'kommentar', 'status', 'admin_note'],
+}
+# Standardwerte des Schemas für leere Zellen (sonst NULL, z.B. status=NULL erscheint in keiner Antrags-Liste)
+IMPORT_STANDARD = {
+    'abwesenheiten': {'status': 'Ausstehend'},
+}
+# Zeitfenster-Spalten pro Tabelle: (Spalte für von, Spalte für bis)
+EXPORT_FENSTER = {
+    'buchungen': ('zeitstempel', 'zeitstempel'),
+    'abwesenheiten': ('end_datum', 'start_datum'),
+    'tagessaldo': ('datum', 'datum'),
+}
+
+
+def cmd_init(pool, args):
+    version = db.init_db(pool)
+    print(f"Schema-Version {version}")
+
+
+def cmd_seed(pool, args):
+    db.init_db(pool)
+    if db.demo_daten_anlegen(pool):
+        print("Demo-Daten angelegt.")
+    else:
+        print("Es existieren bereits Benutzer, keine Demo-Daten angelegt.")
+
+
+def cmd_rebuild_tagessaldo(pool, args):
+    db.init_db(pool)
+    with pool.transaktion() as conn:
+        anzahl = db.tagessaldo_neu_aufbauen(conn)
+    print(f"{anzahl} Tagessalden neu berechnet.")
+
+
+def cmd_kpi_snapshot(pool, args):
+    db.init_db(pool)
+    feiertage = tuple(tag.strip() for tag in args.feiertage.split(',') if tag.strip())
+    t0 = time.perf_counter()
+    snapshot_id = db.kpi_snapshot_erstellen(pool, args.nur_arbeitstage, feiertage)
+    print(f"KPI-Snapshot {snapshot_id} in {time.perf_counter() - t0:.2f} s erstellt.")
+
+
+def cmd_testdaten(pool, args):
+    db.init_db(pool)
+    if db.hat_benutzer(pool):
+        sys.exit("Es existieren bereits Benutzer; Testdaten nur in eine neue Datenbank schreiben.")
+    t0 = time.perf_counter()
+    info = testdaten.firma_anlegen(pool, testdaten.abteilungen_verteilen(args.mitarbeiter), jahre=args.jahre, seed=args.seed)
+    print(f"{info['mitarbeiter']} Mitarbeiter, {info['buchungen']} Buchungen, {info['abwesenheiten']} Abwesenheiten "
+          f"in {time.perf_counter() - t0:.1f} s angelegt.")
+
+
+class Fortschritt:
+    """Zählt Zeilen und meldet Zeilen/Sekunde auf stderr."""
+
+    def __init__(self, text):
+        self.text = text
+        self.zeilen = 0
+        self.gemeldet = None
+        self.start = time.perf_counter()
+
+    def weiter(self, anzahl):
+        vorher = self.zeilen
+        self.zeilen += anzahl
+        if self.zeilen // FORTSCHRITT_ALLE > vorher // FORTSCHRITT_ALLE:
+            self.melden()
+
+    def melden(self):
+        if self.gemeldet == self.zeilen:
+            return
+        self.gemeldet = self.zeilen
+        dauer = max(time.perf_counter() - self.start, 1e-9)
+        print(f"{self.text}: {self.zeilen} Zeilen in {dauer:.1f} s ({self.zeilen / dauer:,.0f} Zeilen/s)", file=sys.stderr)
+
+
+def _format(pfad, format_arg):
+    if format_arg:
+        return format_arg
+    return 'parquet' if str(pfad).endswith('.parquet') else 'csv'
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        sys.exit("Für Parquet wird pyarrow benötigt (pip install pyarrow).")
+    return pyarrow
+
+
+def _arrow_schema(pa, conn, tabelle, spalten):
+    typen = {zeile[1]: (zeile[2] or '').upper() for zeile in conn.execute(f"PRAGMA table_info({tabelle})")}
+    def typ(spalte):
+        if spalte in db.ZEIT_SPALTEN.get(tabelle, ()):
+            return pa.timestamp('s')
+        if typen.get(spalte) == 'INTEGER':
+            return pa.int64()
+        if typen.get(spalte) == 'REAL':
+            return pa.float64()
+        return pa.string()
+    return pa.schema([(spalte, typ(spalte)) for spalte in spalten])
+
+
+def cmd_export(pool, args):
+    tabelle = args.tabelle
+    parquet = _format(args.datei, args.format) == 'parquet'
+    zeit_spalten = db.ZEIT_SPALTEN.get(tabelle, ())
+    fortschritt = Fortschritt(f"Export {tabelle}")
+    with pool.verbindung() as conn:
+        # Parquet bekommt die Sekunden direkt (Timestamp-Spalte), CSV lesbaren Text
+        auswahl = [f"datetime(t.{s}, 'unixepoch') AS {s}" if s in zeit_spalten and not parquet else f"t.{s}"
+                   for s in (zeile[1] for zeile in conn.execute(f"PRAGMA table_info({tabelle})"))]
+        sql, params = f"SELECT {', '.join(auswahl)}, u.full_name AS mitarbeiter FROM {tabelle} t LEFT JOIN users u ON u.id = t.user_id", []
+        if args.von or args.bis:
+            spalte_von, spalte_bis = EXPORT_FENSTER[tabelle]
+            params = list(db.zeitfenster(args.von, args.bis))
+            if spalte_von in zeit_spalten:
+                params = [db.epoch(p) for p in params]
+            sql += f" WHERE t.{spalte_von} >= ? AND t.{spalte_bis} < ?"
+        cursor = conn.execute(sql, params)
+        spalten = [d[0] for d in cursor.description]
+        if parquet:
+            pa = _pyarrow()
+            schema = _arrow_schema(pa, conn, tabelle, spalten)
+            with pa.parquet.ParquetWriter(args.datei, schema) as writer:
+                while zeilen := cursor.fetchmany(args.chunk):
+                    spalten_werte = list(zip(*zeilen))
+                    writer.write_table(pa.table([pa.array(werte, type=feld.type) for werte, feld in zip(spalten_werte, schema)], schema=schema))
+                    fortschritt.weiter(len(zeilen))
+        else:
+            with open(args.datei, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(spalten)
+                while zeilen := cursor.fetchmany(args.chunk):
+                    writer.writerows(zeilen)
+                    fortschritt.weiter(len(zeilen))
+    fortschritt.melden()
+
+
+def _wert(v):
+    # Einheitliches Textformat für Datumsspalten; Zeitpunkte wandelt cmd_import in Sekunden um
+    if isinstance(v, datetime):
+        return v.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(v, date):
+        return v.isoformat()
+    if v == '':
+        return None
+    return v
+
+
+def _lese_bloecke(pfad, format_arg, erlaubt, chunk):
+    """Liefert (spalten, Iterator über Blöcke von Tupeln) für CSV oder Parquet."""
+    if _format(pfad, format_arg) == 'parquet':
+        pa = _pyarrow()
+        datei = pa.parquet.ParquetFile(pfad)
+        spalten = [s for s in datei.schema_arrow.names if s in erlaubt]
+
+        def bloecke():
+            for batch in datei.iter_batches(batch_size=chunk, columns=spalten):
+                yield [tuple(_wert(v) for v in zeile) for zeile in zip(*(spalte.to_pylist() for spalte in batch.columns))]
+        return spalten, bloecke()
+
+    f = open(pfad, newline='', encoding='utf-8')
+    reader = csv.reader(f)
+    kopf = next(reader)
+    indizes = [i for i, s in enumerate(kopf) if s in erlaubt]
+
+    def bloecke():
+        with f:
+            while zeilen := list(itertools.islice(reader, chunk)):
+                yield [tuple(_wert(zeile[i]) for i in indizes) for zeile in zeilen]
+    return [kopf[i] for i in indizes], bloecke()
+
+
+def cmd_import(pool, args):
+    tabelle = args.tabelle
+    db.init_db(pool)
+    spalten, bloecke = _lese_bloecke(args.datei, args.format, IMPORT_SPALTEN[tabelle], args.chunk)
+    if 'user_id' not in spalten and 'mitarbeiter' not in spalten:
+        sys.exit(f"Spalte 'user_id' oder 'mitarbeiter' fehlt in {args.datei}")
+    idx_id = spalten.index('user_id') if 'user_id' in spalten else None
+    idx_name = spalten.index('mitarbeiter') if 'mitarbeiter' in spalten else None
+    # Spaltenpositionen in den gelesenen Tupeln; user_id und mitarbeiter werden zu einer user_id vorne
+    indizes = [i for i, s in enumerate(spalten) if s not in ('user_id', 'mitarbeiter')]
+    ziel = ['user_id'] + [spalten[i] for i in indizes]
+    idx_zeiten = [i for i, s in enumerate(ziel) if s in db.ZEIT_SPALTEN.get(tabelle, ())]
+    standard = [(i, IMPORT_STANDARD.get(tabelle, {})[s]) for i, s in enumerate(ziel) if s in IMPORT_STANDARD.get(tabelle, {})]
+    sql = f"INSERT INTO {tabelle} ({', '.join(ziel)}) VALUES ({', '.join('?' * len(ziel))})"
+    user_ids = set()
+    umgeschluesselt = 0
+    fortschritt = Fortschritt(f"Import {tabelle}")
+    # Eine Transaktion: entweder kommt die ganze Datei an oder gar nichts
+    with pool.transaktion() as conn:
+        namen_zu_ids = {}
+        benutzer = dict(conn.execute("SELECT id, full_name FROM users"))
+        for block in bloecke:
+            zeilen, namen = [], set()
+            for zeile in block:
+                user_id = int(zeile[idx_id]) if idx_id is not None and zeile[idx_id] is not None else None
+                name = zeile[idx_name] if idx_name is not None else None
+                # user_id nur, wenn es sie hier gibt und sie zum Namen passt (Export aus einer anderen Datenbank)
+                if user_id is not None and user_id in benutzer and (name is None or benutzer[user_id] == name):
+                    schluessel = user_id
+                elif name is not None:
+                    schluessel = name
+                    namen.add(name)
+                    umgeschluesselt += user_id is not None
+                elif user_id is not None:
+                    sys.exit(f"user_id {user_id} aus {args.datei} gibt es nicht in {args.db}, und ein Name (mitarbeiter) fehlt; nichts importiert.")
+                else:
+                    schluessel = None
+                zeilen.append([schluessel] + [zeile[i] for i in indizes])
+            if namen - set(namen_zu_ids):
+                neu = db.user_ids_fuer_namen(conn, namen - set(namen_zu_ids))
+                namen_zu_ids.update(neu)
+                benutzer.update({user_id: name for name, user_id in neu.items()})
+            for zeile in zeilen:
+                if isinstance(zeile[0], str):
+                    zeile[0] = namen_zu_ids[zeile[0]]
+                for i in idx_zeiten:
+                    if zeile[i] is not None:
+                        zeile[i] = db.epoch(zeile[i])
+                for i, wert in standard:
+                    if zeile[i] is None:
+                        zeile[i] = wert
+            conn.executemany(sql, zeilen)
+            user_ids.update(zeile[0] for zeile in zeilen)
+            fortschritt.weiter(len(zeilen))
+        fortschritt.melden()
+        if umgeschluesselt:
+            print(f"{umgeschluesselt} Zeilen über den Namen zugeordnet (user_id unbekannt oder anderer Name).", file=sys.stderr)
+        user_ids.discard(None)
+        if tabelle == 'buchungen' and user_ids:
+            anzahl = db.tagessaldo_neu_aufbauen(conn, batch=10, user_ids=user_ids)
+            print(f"{anzahl} Tagessalden für {len(user_ids)} Mitarbeiter neu berechnet.", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=db.DB_NAME, help="Pfad zur SQLite-Datenbank")
+    sub = parser.add_subparsers(dest='befehl', required=True)
+    sub.add_parser('init', help="Schema anlegen / migrieren").set_defaults(fn=cmd_init)
+    sub.add_parser('seed', help="Demo-Daten anlegen").set_defaults(fn=cmd_seed)
+    sub.add_parser('rebuild-tagessaldo', help="Tagessalden neu berechnen").set_defaults(fn=cmd_rebuild_tagessaldo)
+
+    p = sub.add_parser('kpi-snapshot', help="Cockpit-Kennzahlen als Snapshot speichern")
+    p.add_argument('--nur-arbeitstage', action='store_true', help="Urlaub/Krankheit in Arbeitstagen zählen")
+    p.add_argument('--feiertage', default='', help="Kommagetrennte Daten (YYYY-MM-DD)")
+    p.set_defaults(fn=cmd_kpi_snapshot)
+
+    p = sub.add_parser('testdaten', help="Synthetische Firma anlegen (Benchmarks, Lasttests)")
+    p.add_argument('--mitarbeiter', type=int, default=200)
+    p.add_argument('--jahre', type=int, default=1)
+    p.add_argument('--seed', type=int, default=42)
+    p.set_defaults(fn=cmd_testdaten)
+
+    p = sub.add_parser('export', help="Tabelle blockweise als CSV/Parquet exportieren")
+    p.add_argument('tabelle', choices=list(EXPORT_FENSTER))
+    p.add_argument('datei')
+    p.add_argument('--format', choices=['csv', 'parquet'], help="Standard: nach Dateiendung")
+    p.add_argument('--von', type=date.fromisoformat)
+    p.add_argument('--bis', type=date.fromisoformat)
+    p.add_argument('--chunk', type=int, default=CHUNK)
+    p.set_defaults(fn=cmd_export)
+
+    p = sub.add_parser('import', help="CSV/Parquet blockweise in einer Transaktion importieren")
+    p.add_argument('tabelle', choices=list(IMPORT_SPALTEN))
+    p.add_argument('datei')
+    p.add_argument('--format', choices=['csv', 'parquet'], help="Standard: nach Dateiendung")
+    p.add_argument('--chunk', type=int, default=CHUNK)
+    p.set_defaults(fn=cmd_import)
+
+    args = parser.parse_args(argv)
+    pool = db.VerbindungsPool(args.db)
+    try:
+        args.fn(pool, args)
+    finally:
+        pool.schliessen()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""Gemeinsame pytest-Fixtures; liegt im Wurzelverzeichnis, damit die Tests db, auswertung usw. importieren können."""
+import pytest
+
+import db
+
+
+@pytest.fixture
+def pool(tmp_path):
+    """Leere, migrierte Datenbank in einem temporären Verzeichnis."""
+    pool = db.VerbindungsPool(str(tmp_path / 'test.db'))
+    db.init_db(pool)
+    yield pool
+    pool.schliessen()
@@ -0,0 +1,866 @@
+"""Datenbank-Zugriff: gemeinsamer Verbindungs-Pool und alle SQL-Abfragen der App."""
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import messung
+from auswertung import abwesenheiten_auswerten, namen_kategorisch, tagessalden
+
+DB_NAME = 'zeiterfassung_v2.db'
+BUSY_TIMEOUT_MS = 5000
+POOL_GROESSE = 8
+# Sekunden, die verbindung() auf eine freie Verbindung wartet
+POOL_WARTEZEIT = 30
+
+# SQL-Texte als Konstanten: sqlite3 hält pro Verbindung einen Statement-Cache,
+# der über identische SQL-Strings greift. Da die Verbindungen im Pool über alle
+# Reruns hinweg leben, werden die vorbereiteten Statements wiederverwendet.
+SQL_LOGIN = "SELECT * FROM users WHERE username=? AND password=?"
+SQL_USER_DETAILS = "SELECT * FROM users WHERE id=?"
+SQL_USERS_OHNE_ADMIN = "SELECT * FROM users WHERE role='user'"
+SQL_USER_NAMEN = "SELECT id, full_name FROM users"
+SQL_BUCHUNG_NEU = "INSERT INTO buchungen (user_id, projekt, aktion, zeitstempel) VALUES (?, ?, ?, ?)"
+SQL_ANTRAG_NEU = "INSERT INTO abwesenheiten (user_id, start_datum, end_datum, typ, kommentar, status) VALUES (?, ?, ?, ?, ?, 'Ausstehend')"
+SQL_ANTRAG_ENTSCHEIDEN = "UPDATE abwesenheiten SET status=?, admin_note=? WHERE id=?"
+SQL_OFFENE_ANTRAEGE = """SELECT a.id, u.full_name AS mitarbeiter, u.department AS abteilung, a.typ, a.start_datum, a.end_datum, a.kommentar
+    FROM abwesenheiten a LEFT JOIN users u ON u.id = a.user_id
+    WHERE a.status='Ausstehend' AND a.id > ?"""
+SQL_EIGENE_ANTRAEGE = "SELECT * FROM abwesenheiten WHERE user_id=? ORDER BY id DESC"
+SQL_ABWESENHEITSTAGE = "SELECT user_id, start_datum, end_datum, typ, status FROM abwesenheiten WHERE typ IN ('🌴 Urlaub', '🤒 Krank')"
+SQL_ABWESENHEITSTAGE_MITARBEITER = "SELECT user_id, start_datum, end_datum, typ, status FROM abwesenheiten WHERE user_id=? AND typ IN ('🌴 Urlaub', '🤒 Krank')"
+SQL_URLAUBSANSPRUCH = "SELECT id, full_name, vacation_days_total FROM users WHERE role='user'"
+SQL_URLAUBSANSPRUCH_MITARBEITER = "SELECT id, full_name, vacation_days_total FROM users WHERE id=?"
+
+# Zeitfenster für lade_daten; offene Grenzen werden durch MIN_DATUM/MAX_DATUM ersetzt,
+# damit es pro Tabelle nur einen SQL-Text (und ein vorbereitetes Statement) gibt
+MIN_DATUM = '0000-01-01'
+MAX_DATUM = '9999-12-31'
+SQL_FENSTER = {
+    'buchungen': "SELECT * FROM buchungen WHERE zeitstempel >= ? AND zeitstempel < ?",
+    'abwesenheiten': "SELECT * FROM abwesenheiten WHERE end_datum >= ? AND start_datum < ?",
+}
+
+# Zeitpunkte werden als INTEGER (Sekunden seit 1970, Ortszeit wie gestempelt) gespeichert
+ZEIT_SPALTEN = {
+    'buchungen': ('zeitstempel',),
+    'tagessaldo': ('kommen', 'gehen'),
+}
+
+SQL_BUCHUNGEN_TAG = "SELECT user_id, aktion, zeitstempel FROM buchungen WHERE user_id IN ({}) AND zeitstempel >= ? AND zeitstempel < ?"
+MAX_PARAMETER = 500
+SEITE_ANTRAEGE = 25
+
+SQL_TAGESSALDO_LOESCHEN = "DELETE FROM tagessaldo WHERE user_id=? AND datum=?"
+SQL_TAGESSALDO_NEU = "INSERT OR REPLACE INTO tagessaldo (user_id, datum, kommen, gehen, ist, soll, saldo) VALUES (?, ?, ?, ?, ?, ?, ?)"
+SQL_TAGESSALDO_MITARBEITER = "SELECT datum AS Datum, ROUND(ist, 2) AS Ist, soll AS Soll, ROUND(saldo, 2) AS Saldo FROM tagessaldo WHERE user_id=? AND datum >= ? AND datum <= ? ORDER BY datum"
+SQL_TAGESSALDO_ALLE = """SELECT t.datum AS Datum, ROUND(t.ist, 2) AS Ist, t.soll AS Soll, ROUND(t.saldo, 2) AS Saldo, u.full_name AS Mitarbeiter
+    FROM tagessaldo t LEFT JOIN users u ON u.id = t.user_id WHERE t.datum >= ? AND t.datum <= ? ORDER BY t.datum, u.full_name"""
+SQL_SALDO_MITARBEITER = "SELECT ROUND(COALESCE(SUM(saldo), 0), 2) FROM tagessaldo WHERE user_id=?"
+SQL_SALDO_ALLE = "SELECT ROUND(COALESCE(SUM(saldo), 0), 2) FROM tagessaldo"
+
+# Firmen-Cockpit: nur Aggregate, damit Speicher und Laufzeit nicht mit buchungen wachsen
+SQL_COCKPIT_IST = "SELECT COALESCE(SUM(ist), 0) FROM tagessaldo"
+SQL_COCKPIT_KRANK = "SELECT COUNT(*) FROM abwesenheiten WHERE typ='🤒 Krank' AND start_datum <= ? AND end_datum >= ?"
+SQL_COCKPIT_USERS = "SELECT COUNT(*) FROM users WHERE role='user'"
+SQL_COCKPIT_ABTEILUNGEN = """SELECT u.department AS Abteilung, SUM(s.stunden) AS Stunden
+    FROM (SELECT user_id, SUM(ist) AS stunden FROM tagessaldo GROUP BY user_id) s
+    JOIN users u ON u.id = s.user_id
+    GROUP BY u.department ORDER BY u.department"""
+SQL_COCKPIT_TREND = "SELECT datum AS Datum, SUM(ist) AS Ist FROM tagessaldo GROUP BY datum ORDER BY datum"
+
+TABELLEN = ('buchungen', 'abwesenheiten')
+
+
+def verbinden(db_name, synchronous='NORMAL'):
+    """Öffnet eine Verbindung mit WAL-Journal und Busy-Timeout.
+
+    isolation_level=None: Lesezugriffe laufen im Autocommit, Schreibzugriffe
+    öffnen ihre Transaktion explizit über VerbindungsPool.transaktion().
+    Abfragen werden innerhalb eines messung.lauf() mit Dauer und Zeilenzahl erfasst.
+    """
+    conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           isolation_level=None, cached_statements=256, factory=messung.MessVerbindung)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        # NORMAL ist in WAL-Modus konsistent: kein fsync pro Commit, nur beim Checkpoint.
+        # FULL (fsync pro Commit) nutzt die BuchungsWarteschlange für ihre Bestätigungen.
+        conn.execute(f"PRAGMA synchronous={synchronous}")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+class VerbindungsPool:
+    """Thread-sicherer Pool, geteilt von allen Sessions eines Streamlit-Prozesses."""
+
+    def __init__(self, db_name, groesse=POOL_GROESSE, synchronous='NORMAL'):
+        self.db_name = db_name
+        self.synchronous = synchronous
+        self._frei = queue.LifoQueue(maxsize=groesse)
+        # Verbindungen werden erst bei Bedarf geöffnet
+        for _ in range(groesse):
+            self._frei.put(None)
+
+    @contextmanager
+    def verbindung(self):
+        # Wartezeit auf eine freie Verbindung bzw. Öffnen einer neuen
+        with messung.messen('db', 'verbindung'):
+            try:
+                conn = self._frei.get(timeout=POOL_WARTEZEIT)
+            except queue.Empty:
+                raise sqlite3.OperationalError(
+                    f"Keine freie Datenbank-Verbindung nach {POOL_WARTEZEIT} s (Pool mit {self._frei.maxsize} Verbindungen ausgelastet)") from None
+            if conn is None:
+                try:
+                    conn = verbinden(self.db_name, self.synchronous)
+                except BaseException:
+                    # Platz zurückgeben, sonst ist der Pool nach POOL_GROESSE Fehlern dauerhaft leer
+                    self._frei.put(None)
+                    raise
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._frei.put(conn)
+
+    @contextmanager
+    def transaktion(self):
+        """Schreib-Transaktion; BEGIN IMMEDIATE holt die Schreibsperre sofort (mit Busy-Timeout)."""
+        with self.verbindung() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def schliessen(self):
+        while True:
+            try:
+                conn = self._frei.get_nowait()
+            except queue.Empty:
+                return
+            if conn is not None:
+                conn.close()
+
+
+# --- ZEITSTEMPEL ---
+
+def epoch(zeit):
+    """Zeitpunkt (datetime, date oder ISO-Text) als Sekunden seit 1970; Ganzzahlen bleiben unverändert."""
+    if isinstance(zeit, (int, np.integer)) or (isinstance(zeit, str) and zeit.isdigit()):
+        return int(zeit)
+    return int(np.datetime64(str(zeit), 's').astype('int64'))
+
+
+def zeiten_umwandeln(df, tabelle):
+    """Wandelt die INTEGER-Zeitspalten einer gelesenen Tabelle ohne Parsen in datetime64[s] um."""
+    for spalte in ZEIT_SPALTEN.get(tabelle, ()):
+        if spalte in df:
+            df[spalte] = df[spalte].astype('datetime64[s]')
+    return df
+
+
+def _als_datetime(sekunden):
+    """Gegenstück zu epoch() für einzelne Werte."""
+    return np.datetime64(int(sekunden), 's').astype(datetime)
+
+
+def _epochen(spalte):
+    werte = spalte.astype('datetime64[s]')
+    return [None if fehlt else v for v, fehlt in zip(werte.to_numpy().astype('int64').tolist(), werte.isna().tolist())]
+
+
+# --- TAGESSALDO ---
+# Vorberechnete Tageswerte pro (user_id, datum). Wird bei jeder Buchung für
+# den betroffenen Tag und seine Nachbartage nachgeführt; tagessaldo_neu_aufbauen() erzeugt sie komplett aus buchungen.
+
+def _tagessaldo_zeilen(tage):
+    return list(zip(tage['user_id'].tolist(), tage['datum'].dt.strftime('%Y-%m-%d').tolist(),
+                    _epochen(tage['kommen']), _epochen(tage['gehen']),
+                    tage['ist'].tolist(), tage['soll'].tolist(), tage['saldo'].tolist()))
+
+
+def tage_aktualisieren(conn, user_id, tage):
+    """Berechnet die Tagessalden eines Mitarbeiters für die angegebenen Tage (YYYY-MM-DD) neu."""
+    tagessalden_aktualisieren(conn, {user_id: tage})
+
+
+def tagessalden_aktualisieren(conn, tage_je_mitarbeiter):
+    """Wie tage_aktualisieren für viele Mitarbeiter ({user_id: Tage}): eine Abfrage pro Tag statt pro Mitarbeiter und Tag.
+
+    Über Schichten nach Mitternacht kann ein Stempel auch Vor- und Folgetag ändern; neu berechnet
+    werden daher Tag-1 bis Tag+1 aus den Stempeln von Tag-2 bis Tag+2 (siehe MAX_SCHICHT_STUNDEN).
+    """
+    je_tag = {}
+    for user_id, tage in tage_je_mitarbeiter.items():
+        for tag in set(tage):
+            je_tag.setdefault(tag, []).append(user_id)
+    for tag, user_ids in je_tag.items():
+        mitte = date.fromisoformat(tag)
+        neu = [str(mitte + timedelta(days=d)) for d in (-1, 0, 1)]
+        von, bis = epoch(mitte - timedelta(days=2)), epoch(mitte + timedelta(days=3))
+        for i in range(0, len(user_ids), MAX_PARAMETER):
+            teil = user_ids[i:i + MAX_PARAMETER]
+            sql = SQL_BUCHUNGEN_TAG.format(",".join("?" * len(teil)))
+            df = zeiten_umwandeln(pd.read_sql_query(sql, conn, params=[*teil, von, bis]), 'buchungen')
+            conn.executemany(SQL_TAGESSALDO_LOESCHEN, [(user_id, t) for user_id in teil for t in neu])
+            if not df.empty:
+                tage = tagessalden(df)
+                tage = tage[tage['datum'].between(pd.Timestamp(neu[0]), pd.Timestamp(neu[-1]))]
+                conn.executemany(SQL_TAGESSALDO_NEU, _tagessaldo_zeilen(tage))
+
+
+def tagessaldo_neu_aufbauen(conn, batch=100, user_ids=None):
+    """Erzeugt tagessaldo neu, jeweils `batch` Mitarbeiter auf einmal im Speicher.
+
+    Ohne `user_ids` für alle, sonst nur für die übergebenen Mitarbeiter.
+    """
+    if user_ids is None:
+        conn.execute("DELETE FROM tagessaldo")
+        ids = [zeile[0] for zeile in conn.execute("SELECT DISTINCT user_id FROM buchungen WHERE user_id IS NOT NULL")]
+    else:
+        ids = sorted(user_ids)
+        conn.executemany("DELETE FROM tagessaldo WHERE user_id=?", [(i,) for i in ids])
+    anzahl = 0
+    for i in range(0, len(ids), batch):
+        teil = ids[i:i + batch]
+        platzhalter = ",".join("?" * len(teil))
+        df = zeiten_umwandeln(pd.read_sql_query(f"SELECT user_id, aktion, zeitstempel FROM buchungen WHERE user_id IN ({platzhalter})", conn, params=teil), 'buchungen')
+        zeilen = _tagessaldo_zeilen(tagessalden(df))
+        conn.executemany(SQL_TAGESSALDO_NEU, zeilen)
+        anzahl += len(zeilen)
+    return anzahl
+
+
+# --- SCHEMA & MIGRATIONEN ---
+
+# Jede Migration hebt PRAGMA user_version um eins. Einträge sind SQL-Strings
+# oder Funktionen, die eine Verbindung erhalten. Neue Schritte nur anhängen,
+# bestehende nie ändern: ausgelieferte Datenbanken haben sie bereits ausgeführt.
+# Migrationen dürfen keinen App-Code aufrufen, der das aktuelle Schema voraussetzt:
+# abgeleitete Daten werden über die Tabelle wartung nach allen Migrationen erzeugt.
+
+def _migration_user_id(conn):
+    """Integer-Schlüssel für users; buchungen, abwesenheiten und tagessaldo verweisen per user_id darauf."""
+    # id als letzte Spalte, damit SELECT * auf users seine bisherigen Positionen behält
+    conn.execute("CREATE TABLE users_neu (username TEXT NOT NULL UNIQUE, password TEXT, role TEXT, full_name TEXT, department TEXT, job_title TEXT, vacation_days_total INTEGER, id INTEGER PRIMARY KEY)")
+    conn.execute("INSERT INTO users_neu (username, password, role, full_name, department, job_title, vacation_days_total) SELECT username, password, role, full_name, department, job_title, vacation_days_total FROM users ORDER BY rowid")
+    conn.execute("CREATE INDEX idx_users_neu_full_name ON users_neu (full_name)")
+    # Namen in der Historie ohne passenden Benutzer (z.B. nach Umbenennung) als inaktive Benutzer übernehmen
+    verwaist = [zeile[0] for zeile in conn.execute("""SELECT name FROM (SELECT mitarbeiter AS name FROM buchungen UNION SELECT mitarbeiter FROM abwesenheiten)
+        WHERE name IS NOT NULL AND name NOT IN (SELECT full_name FROM users_neu WHERE full_name IS NOT NULL) ORDER BY name""")]
+    conn.executemany("INSERT INTO users_neu (username, role, full_name) VALUES (?, 'inaktiv', ?)",
+                     [(f"inaktiv_{i}", name) for i, name in enumerate(verwaist, start=1)])
+    user_id = "(SELECT MIN(u.id) FROM users_neu u WHERE u.full_name = t.mitarbeiter)"
+
+    conn.execute("CREATE TABLE buchungen_neu (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER REFERENCES users(id), projekt TEXT, aktion TEXT, zeitstempel DATETIME)")
+    conn.execute(f"INSERT INTO buchungen_neu (id, user_id, projekt, aktion, zeitstempel) SELECT t.id, {user_id}, t.projekt, t.aktion, t.zeitstempel FROM buchungen t ORDER BY t.id")
+    conn.execute("CREATE TABLE abwesenheiten_neu (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER REFERENCES users(id), start_datum DATE, end_datum DATE, typ TEXT, kommentar TEXT, status TEXT DEFAULT 'Ausstehend', admin_note TEXT)")
+    conn.execute(f"INSERT INTO abwesenheiten_neu (id, user_id, start_datum, end_datum, typ, kommentar, status, admin_note) SELECT t.id, {user_id}, t.start_datum, t.end_datum, t.typ, t.kommentar, t.status, t.admin_note FROM abwesenheiten t ORDER BY t.id")
+    conn.execute("CREATE TABLE tagessaldo_neu (user_id INTEGER NOT NULL, datum TEXT NOT NULL, kommen DATETIME, gehen DATETIME, ist REAL NOT NULL, soll REAL NOT NULL, saldo REAL NOT NULL, PRIMARY KEY (user_id, datum)) WITHOUT ROWID")
+    conn.execute(f"INSERT INTO tagessaldo_neu SELECT {user_id}, t.datum, t.kommen, t.gehen, t.ist, t.soll, t.saldo FROM tagessaldo t WHERE {user_id} IS NOT NULL")
+
+    for tabelle in ('buchungen', 'abwesenheiten', 'tagessaldo', 'users'):
+        conn.execute(f"DROP TABLE {tabelle}")
+        conn.execute(f"ALTER TABLE {tabelle}_neu RENAME TO {tabelle}")
+    conn.execute("DROP INDEX idx_users_neu_full_name")
+    for sql in (
+        "CREATE INDEX idx_users_full_name ON users (full_name)",
+        "CREATE INDEX idx_buchungen_user_zeit ON buchungen (user_id, zeitstempel)",
+        "CREATE INDEX idx_buchungen_zeit ON buchungen (zeitstempel)",
+        "CREATE INDEX idx_abwesenheiten_user_typ ON abwesenheiten (user_id, typ, status)",
+        "CREATE INDEX idx_abwesenheiten_status_typ ON abwesenheiten (status, typ)",
+        "CREATE INDEX idx_abwesenheiten_typ_datum ON abwesenheiten (typ, start_datum, end_datum)",
+        "CREATE INDEX idx_abwesenheiten_status_id ON abwesenheiten (status, id)",
+        "CREATE INDEX idx_tagessaldo_datum_ist ON tagessaldo (datum, ist)",
+    ):
+        conn.execute(sql)
+
+
+MIGRATIONEN = [
+    # 1: Ausgangsschema (bestehende zeiterfassung_v2.db haben es schon, daher IF NOT EXISTS)
+    [
+        "CREATE TABLE IF NOT EXISTS buchungen (id INTEGER PRIMARY KEY AUTOINCREMENT, mitarbeiter TEXT, projekt TEXT, aktion TEXT, zeitstempel DATETIME)",
+        "CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT, role TEXT, full_name TEXT, department TEXT, job_title TEXT, vacation_days_total INTEGER)",
+        "CREATE TABLE IF NOT EXISTS abwesenheiten (id INTEGER PRIMARY KEY AUTOINCREMENT, mitarbeiter TEXT, start_datum DATE, end_datum DATE, typ TEXT, kommentar TEXT, status TEXT DEFAULT 'Ausstehend', admin_note TEXT)",
+    ],
+    # 2: Indizes für die Abfragen pro Mitarbeiter und die Antrags-Queue
+    [
+        "CREATE INDEX IF NOT EXISTS idx_buchungen_mitarbeiter_zeit ON buchungen (mitarbeiter, zeitstempel)",
+        "CREATE INDEX IF NOT EXISTS idx_abwesenheiten_mitarbeiter_typ ON abwesenheiten (mitarbeiter, typ, status)",
+        "CREATE INDEX IF NOT EXISTS idx_abwesenheiten_status_typ ON abwesenheiten (status, typ)",
+        "CREATE INDEX IF NOT EXISTS idx_users_full_name ON users (full_name)",
+        "ANALYZE",
+    ],
+    # 3: Vorberechnete Tagessalden; befüllt werden sie nach den Migrationen (wartung)
+    [
+        "CREATE TABLE IF NOT EXISTS tagessaldo (mitarbeiter TEXT NOT NULL, datum TEXT NOT NULL, kommen DATETIME, gehen DATETIME, ist REAL NOT NULL, soll REAL NOT NULL, saldo REAL NOT NULL, PRIMARY KEY (mitarbeiter, datum)) WITHOUT ROWID",
+        "CREATE INDEX IF NOT EXISTS idx_tagessaldo_datum ON tagessaldo (datum)",
+        "CREATE TABLE IF NOT EXISTS wartung (aufgabe TEXT PRIMARY KEY)",
+        "INSERT OR IGNORE INTO wartung (aufgabe) VALUES ('tagessaldo')",
+    ],
+    # 4: Abdeckender Index für Summen pro Tag im Firmen-Cockpit
+    [
+        "DROP INDEX IF EXISTS idx_tagessaldo_datum",
+        "CREATE INDEX IF NOT EXISTS idx_tagessaldo_datum_ist ON tagessaldo (datum, ist)",
+        "CREATE INDEX IF NOT EXISTS idx_abwesenheiten_typ_datum ON abwesenheiten (typ, start_datum, end_datum)",
+    ],
+    # 5: Keyset-Paginierung der offenen Anträge (status=? AND id > ? ORDER BY id)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_abwesenheiten_status_id ON abwesenheiten (status, id)",
+    ],
+    # 6: Zeitfenster über alle Mitarbeiter (lade_daten als Admin)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_buchungen_zeit ON buchungen (zeitstempel)",
+    ],
+    # 7: user_id statt full_name als Schlüssel; eine Umbenennung verwaist keine Historie mehr
+    [
+        "CREATE TABLE IF NOT EXISTS wartung (aufgabe TEXT PRIMARY KEY)",
+        _migration_user_id,
+    ],
+    # 8: Zeitpunkte als Sekunden seit 1970 statt Text; der Lesepfad muss nichts mehr parsen
+    [
+        "CREATE TABLE buchungen_neu (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER REFERENCES users(id), projekt TEXT, aktion TEXT, zeitstempel INTEGER)",
+        """INSERT INTO buchungen_neu (id, user_id, projekt, aktion, zeitstempel)
+            SELECT id, user_id, projekt, aktion, CASE WHEN typeof(zeitstempel) = 'integer' THEN zeitstempel ELSE CAST(strftime('%s', zeitstempel) AS INTEGER) END
+            FROM buchungen ORDER BY id""",
+        "DROP TABLE buchungen",
+        "ALTER TABLE buchungen_neu RENAME TO buchungen",
+        "CREATE INDEX idx_buchungen_user_zeit ON buchungen (user_id, zeitstempel)",
+        "CREATE INDEX idx_buchungen_zeit ON buchungen (zeitstempel)",
+        "CREATE TABLE tagessaldo_neu (user_id INTEGER NOT NULL, datum TEXT NOT NULL, kommen INTEGER, gehen INTEGER, ist REAL NOT NULL, soll REAL NOT NULL, saldo REAL NOT NULL, PRIMARY KEY (user_id, datum)) WITHOUT ROWID",
+        """INSERT INTO tagessaldo_neu
+            SELECT user_id, datum, CAST(strftime('%s', kommen) AS INTEGER), CAST(strftime('%s', gehen) AS INTEGER), ist, soll, saldo FROM tagessaldo""",
+        "DROP TABLE tagessaldo",
+        "ALTER TABLE tagessaldo_neu RENAME TO tagessaldo",
+        "CREATE INDEX idx_tagessaldo_datum_ist ON tagessaldo (datum, ist)",
+    ],
+    # 9: Vorberechnete Cockpit-Kennzahlen (Hintergrund-Aktualisierung, siehe hintergrund.py)
+    [
+        "CREATE TABLE IF NOT EXISTS kpi_snapshot (id INTEGER PRIMARY KEY AUTOINCREMENT, erstellt INTEGER NOT NULL, letzte_buchung INTEGER NOT NULL, daten TEXT NOT NULL)",
+    ],
+    # 10: Ist ohne Pausen, Nachtschichten am Tag des Kommen: tagessaldo und Cockpit neu berechnen
+    [
+        "INSERT OR IGNORE INTO wartung (aufgabe) VALUES ('tagessaldo')",
+        "DELETE FROM kpi_snapshot",
+    ],
+]
+
+# Nacharbeiten, die Migrationen in der Tabelle wartung anmelden
+WARTUNG = {
+    'tagessaldo': tagessaldo_neu_aufbauen,
+}
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrieren(conn, migrationen=MIGRATIONEN):
+    """Bringt die Datenbank schrittweise auf den neuesten Stand, jede Stufe in eigener Transaktion.
+
+    Die Version wird erst nach BEGIN IMMEDIATE gelesen, damit parallel startende
+    Prozesse eine Stufe nicht doppelt ausführen.
+    """
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version >= len(migrationen):
+                conn.rollback()
+                return version
+            for schritt in migrationen[version]:
+                if callable(schritt):
+                    schritt(conn)
+                else:
+                    conn.execute(schritt)
+            conn.execute(f"PRAGMA user_version={version + 1}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def wartung_ausfuehren(conn):
+    """Führt angemeldete Nacharbeiten mit dem aktuellen Schema aus, jede in eigener Transaktion."""
+    for aufgabe, fn in WARTUNG.items():
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM wartung WHERE aufgabe=?", (aufgabe,)).fetchone():
+                fn(conn)
+                conn.execute("DELETE FROM wartung WHERE aufgabe=?", (aufgabe,))
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def init_db(pool):
+    """Einmaliger Start-Schritt pro Prozess: Schema anlegen bzw. migrieren."""
+    with pool.verbindung() as conn:
+        version = migrieren(conn)
+        wartung_ausfuehren(conn)
+    return version
+
+
+def hat_benutzer(pool):
+    with pool.verbindung() as conn:
+        return conn.execute('SELECT 1 FROM users LIMIT 1').fetchone() is not None
+
+
+def demo_daten_anlegen(pool):
+    """Legt Demo-Benutzer und -Buchungen an, falls noch keine Benutzer existieren."""
+    with pool.transaktion() as c:
+        # Check ob User existieren
+        if c.execute('SELECT count(*) FROM users').fetchone()[0] == 0:
+            users = [
+                ('admin', 'admin123', 'admin', 'Personalabteilung (HR)', 'HR', 'Head of HR', 30),
+                ('max', '1234', 'user', 'Max Mustermann', 'IT', 'Senior Developer', 30),
+                ('erika', '1234', 'user', 'Erika Musterfrau', 'Marketing', 'Content Manager', 28)
+            ]
+            c.executemany('INSERT INTO users (username, password, role, full_name, department, job_title, vacation_days_total) VALUES (?,?,?,?,?,?,?)', users)
+            max_id = c.execute("SELECT id FROM users WHERE username='max'").fetchone()[0]
+
+            # Demo Buchungen
+            heute = date.today()
+            buchungen, tage = [], []
+            for i in range(1, 6):
+                tag = heute - timedelta(days=i)
+                if tag.weekday() < 5:
+                    buchungen.append((max_id, "Web-Entwicklung", "Kommen", epoch(f"{tag} 08:00:00")))
+                    buchungen.append((max_id, "Web-Entwicklung", "Gehen", epoch(f"{tag} 17:00:00")))
+                    tage.append(str(tag))
+            c.executemany(SQL_BUCHUNG_NEU, buchungen)
+            tage_aktualisieren(c, max_id, tage)
+
+            next_mon = heute + timedelta(days=10)
+            c.execute("INSERT INTO abwesenheiten (user_id, start_datum, end_datum, typ, kommentar, status) VALUES (?, ?, ?, ?, ?, ?)",
+                      (max_id, str(next_mon), str(next_mon + timedelta(days=4)), "🌴 Urlaub", "Sommerurlaub bitte!", "Ausstehend"))
+            return True
+    return False
+
+
+# Abfragen, die bei jedem Seitenaufbau laufen und einen Index nutzen müssen
+HOT_QUERIES = {
+    'lade_daten (Mitarbeiter)': (SQL_FENSTER['buchungen'] + " AND user_id=?", (1704067200, 1706745600, 1)),
+    'lade_daten (Zeitraum)': (SQL_FENSTER['buchungen'], (1704067200, 1704672000)),
+    'abwesenheitstage (Mitarbeiter)': (SQL_ABWESENHEITSTAGE_MITARBEITER, (1,)),
+    'eigene Anträge': (SQL_EIGENE_ANTRAEGE, (1,)),
+    'offene Anträge': (SQL_OFFENE_ANTRAEGE + " ORDER BY a.id LIMIT ?", (0, SEITE_ANTRAEGE)),
+    'get_user_details': (SQL_USER_DETAILS, (1,)),
+    'tagessaldo (Mitarbeiter)': (SQL_TAGESSALDO_MITARBEITER, (1, '2024-01-01', '2024-01-07')),
+    'saldo (Mitarbeiter)': (SQL_SALDO_MITARBEITER, (1,)),
+    'buchungen eines Tages': (SQL_BUCHUNGEN_TAG.format("?,?"), (1, 2, 1704067200, 1704153600)),
+    'cockpit krank': (SQL_COCKPIT_KRANK, ('2024-01-01', '2024-01-01')),
+    'cockpit trend': (SQL_COCKPIT_TREND, ()),
+}
+
+
+def query_plan(conn, sql, params=()):
+    return [zeile[3] for zeile in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def pruefe_query_plaene(conn, queries=HOT_QUERIES):
+    """Liefert {name: plan} für alle Abfragen, die eine Tabelle komplett scannen."""
+    scans = {}
+    for name, (sql, params) in queries.items():
+        plan = query_plan(conn, sql, params)
+        # "SCAN (subquery-n)" durchläuft nur ein Zwischenergebnis, keine Tabelle
+        if any(schritt.startswith('SCAN') and 'USING' not in schritt and '(subquery' not in schritt for schritt in plan):
+            scans[name] = plan
+    return scans
+
+
+# --- LESEN ---
+
+def get_all_users_full(pool):
+    with pool.verbindung() as conn:
+        return pd.read_sql_query(SQL_USERS_OHNE_ADMIN, conn)
+
+def get_company_stats(pool, stichtag=None, nur_arbeitstage=False, feiertage=()):
+    """Kennzahlen für das Firmen-Cockpit; Stunden in SQL aggregiert, Abwesenheiten über abwesenheits_kennzahlen."""
+    heute = str(stichtag or date.today())
+    with pool.verbindung() as conn:
+        ist = conn.execute(SQL_COCKPIT_IST).fetchone()[0]
+        krank = conn.execute(SQL_COCKPIT_KRANK, (heute, heute)).fetchone()[0]
+        mitarbeiter = conn.execute(SQL_COCKPIT_USERS).fetchone()[0]
+        abteilungen = pd.read_sql_query(SQL_COCKPIT_ABTEILUNGEN, conn)
+        trend = pd.read_sql_query(SQL_COCKPIT_TREND, conn)
+    abwesenheiten = abwesenheits_kennzahlen(pool, None, nur_arbeitstage, feiertage)
+    urlaub, urlaub_gesamt = abwesenheiten['urlaub_genommen'].sum(), abwesenheiten['urlaub_gesamt'].sum()
+    return {
+        'ist_gesamt': ist,
+        'krank': krank,
+        'urlaub_genommen': int(urlaub),
+        'urlaub_gesamt': int(urlaub_gesamt),
+        'urlaubsquote': (urlaub / urlaub_gesamt * 100) if urlaub_gesamt > 0 else 0,
+        'mitarbeiter': mitarbeiter,
+        'abteilungen': abteilungen.set_index('Abteilung')['Stunden'],
+        'trend': trend.assign(Datum=pd.to_datetime(trend['Datum'])).set_index('Datum')['Ist'],
+        'abwesenheiten': abwesenheiten,
+    }
+
+def get_user_details(pool, user_id):
+    with pool.verbindung() as conn:
+        return conn.execute(SQL_USER_DETAILS, (user_id,)).fetchone()
+
+def login_user(pool, username, password):
+    with pool.verbindung() as conn:
+        return conn.execute(SQL_LOGIN, (username.lower(), password)).fetchone()
+
+def zeitfenster(von, bis):
+    """[von, bis] (inklusive, Datum oder None) als halboffenes Intervall [von, bis + 1 Tag)."""
+    von = str(von) if von else MIN_DATUM
+    bis = str(date.fromisoformat(str(bis)) + timedelta(days=1)) if bis else MAX_DATUM
+    return von, bis
+
+def lade_daten(pool, table, user_role, user_id, von=None, bis=None):
+    """Zeilen aus buchungen/abwesenheiten im Zeitraum [von, bis], mit Namen als Categorical in `mitarbeiter`.
+
+    Mitarbeiter sehen nur ihre eigenen Daten; Admins alle (user_id='all') oder einen bestimmten Mitarbeiter.
+    """
+    if table not in TABELLEN:
+        raise ValueError(f"Unbekannte Tabelle: {table}")
+    sql, params = SQL_FENSTER[table], list(zeitfenster(von, bis))
+    if table in ZEIT_SPALTEN:
+        params = [epoch(p) for p in params]
+    if user_role != 'admin' or user_id != 'all':
+        sql += " AND user_id=?"
+        params.append(user_id)
+    with pool.verbindung() as conn:
+        df = zeiten_umwandeln(pd.read_sql_query(sql, conn, params=params, dtype={'user_id': 'Int64'}), table)
+        df['mitarbeiter'] = namen_kategorisch(df['user_id'], pd.read_sql_query(SQL_USER_NAMEN, conn))
+    return df
+
+def lade_tagessalden(pool, user_id, von=None, bis=None):
+    """Tageswerte aus tagessaldo im Format von berechne_kpis: (DataFrame, Gesamtsaldo).
+
+    Das DataFrame enthält nur die Tage in [von, bis]; der Saldo ist immer der Gesamtsaldo.
+    """
+    fenster = (str(von) if von else MIN_DATUM, str(bis) if bis else MAX_DATUM)
+    with pool.verbindung() as conn:
+        if user_id == 'all':
+            df = pd.read_sql_query(SQL_TAGESSALDO_ALLE, conn, params=fenster)
+            saldo = conn.execute(SQL_SALDO_ALLE).fetchone()[0]
+        else:
+            df = pd.read_sql_query(SQL_TAGESSALDO_MITARBEITER, conn, params=(user_id,) + fenster)
+            saldo = conn.execute(SQL_SALDO_MITARBEITER, (user_id,)).fetchone()[0]
+    # datum ist TEXT; als Datum, damit Diagramme eine Zeitachse bekommen
+    df['Datum'] = pd.to_datetime(df['Datum'])
+    return df, saldo
+
+def _antrags_filter(abteilung, typ, von, bis):
+    sql, params = "", []
+    if abteilung:
+        sql += " AND u.department = ?"
+        params.append(abteilung)
+    if typ:
+        sql += " AND a.typ = ?"
+        params.append(typ)
+    # Zeitraum: Anträge, die sich mit [von, bis] überschneiden
+    if von:
+        sql += " AND a.end_datum >= ?"
+        params.append(str(von))
+    if bis:
+        sql += " AND a.start_datum <= ?"
+        params.append(str(bis))
+    return sql, params
+
+def lade_offene_antraege(pool, nach_id=0, limit=SEITE_ANTRAEGE, abteilung=None, typ=None, von=None, bis=None):
+    """Eine Seite offener Anträge mit id > nach_id (Keyset-Paginierung, kein OFFSET)."""
+    filter_sql, params = _antrags_filter(abteilung, typ, von, bis)
+    with pool.verbindung() as conn:
+        return pd.read_sql_query(SQL_OFFENE_ANTRAEGE + filter_sql + " ORDER BY a.id LIMIT ?", conn,
+                                 params=[int(nach_id)] + params + [int(limit)])
+
+def zaehle_offene_antraege(pool, abteilung=None, typ=None, von=None, bis=None):
+    filter_sql, params = _antrags_filter(abteilung, typ, von, bis)
+    sql = "SELECT COUNT(*) FROM abwesenheiten a LEFT JOIN users u ON u.id = a.user_id WHERE a.status='Ausstehend'"
+    with pool.verbindung() as conn:
+        return conn.execute(sql + filter_sql, params).fetchone()[0]
+
+def lade_eigene_antraege(pool, user_id):
+    with pool.verbindung() as conn:
+        return pd.read_sql_query(SQL_EIGENE_ANTRAEGE, conn, params=(user_id,))
+
+def abwesenheits_kennzahlen(pool, user_id=None, nur_arbeitstage=False, feiertage=()):
+    """Urlaub genommen/Rest und Krankheitstage pro Mitarbeiter, für einen (user_id) oder alle (None).
+
+    Zwei Abfragen unabhängig von der Zahl der Mitarbeiter.
+    """
+    with pool.verbindung() as conn:
+        if user_id is None:
+            df_a = pd.read_sql_query(SQL_ABWESENHEITSTAGE, conn)
+            df_u = pd.read_sql_query(SQL_URLAUBSANSPRUCH, conn)
+        else:
+            df_a = pd.read_sql_query(SQL_ABWESENHEITSTAGE_MITARBEITER, conn, params=(user_id,))
+            df_u = pd.read_sql_query(SQL_URLAUBSANSPRUCH_MITARBEITER, conn, params=(user_id,))
+    return abwesenheiten_auswerten(df_a, df_u, nur_arbeitstage, feiertage)
+
+def get_vacation_stats(pool, user_id, total_days, nur_arbeitstage=False, feiertage=()):
+    """(genommen, rest) Urlaubstage eines Mitarbeiters bei `total_days` Anspruch."""
+    taken = int(abwesenheits_kennzahlen(pool, user_id, nur_arbeitstage, feiertage)['urlaub_genommen'].sum())
+    return taken, total_days - taken
+
+def count_sick_days(pool, user_id, nur_arbeitstage=False, feiertage=()):
+    return int(abwesenheits_kennzahlen(pool, user_id, nur_arbeitstage, feiertage)['krank_tage'].sum())
+
+
+# --- KPI-SNAPSHOTS ---
+# Das Cockpit liest den letzten Snapshot statt get_company_stats im Request zu rechnen.
+# letzte_buchung merkt sich die höchste buchungen.id, damit der Hintergrund-Thread
+# nach N neuen Stempeln neu rechnen kann.
+
+KPI_SNAPSHOTS_BEHALTEN = 100
+SQL_SNAPSHOT_NEU = "INSERT INTO kpi_snapshot (erstellt, letzte_buchung, daten) VALUES (?, ?, ?)"
+SQL_SNAPSHOT_LETZTER = "SELECT id, erstellt, letzte_buchung FROM kpi_snapshot ORDER BY id DESC LIMIT 1"
+SQL_SNAPSHOT_DATEN = "SELECT erstellt, daten FROM kpi_snapshot WHERE id=?"
+SQL_LETZTE_BUCHUNG = "SELECT COALESCE(MAX(id), 0) FROM buchungen"
+SQL_NEUE_BUCHUNGEN = "SELECT COUNT(*) FROM buchungen WHERE id > ?"
+
+def _snapshot_json(stats):
+    def reihe(s):
+        index = s.index.strftime('%Y-%m-%d') if isinstance(s.index, pd.DatetimeIndex) else s.index
+        return {'index': index.tolist(), 'werte': s.tolist()}
+    return json.dumps({
+        **{k: stats[k] for k in ('ist_gesamt', 'krank', 'urlaub_genommen', 'urlaub_gesamt', 'mitarbeiter')},
+        'urlaubsquote': float(stats['urlaubsquote']),
+        'abteilungen': reihe(stats['abteilungen']),
+        'trend': reihe(stats['trend']),
+        'abwesenheiten': stats['abwesenheiten'].reset_index().to_dict('list'),
+    }, ensure_ascii=False)
+
+def _snapshot_laden(text):
+    """Gegenstück zu _snapshot_json: dieselbe Struktur wie get_company_stats."""
+    stats = json.loads(text)
+    stats['abteilungen'] = pd.Series(stats['abteilungen']['werte'], index=pd.Index(stats['abteilungen']['index'], name='Abteilung'), name='Stunden', dtype='float64')
+    stats['trend'] = pd.Series(stats['trend']['werte'], index=pd.DatetimeIndex(pd.to_datetime(stats['trend']['index']), name='Datum'), name='Ist', dtype='float64')
+    stats['abwesenheiten'] = pd.DataFrame(stats['abwesenheiten']).set_index('user_id')
+    return stats
+
+def kpi_snapshot_erstellen(pool, nur_arbeitstage=False, feiertage=()):
+    """Berechnet die Cockpit-Kennzahlen und speichert sie als neuen Snapshot; gibt dessen id zurück."""
+    # Vor dem Rechnen lesen: Stempel während der Berechnung lösen den nächsten Lauf aus
+    with pool.verbindung() as conn:
+        letzte_buchung = conn.execute(SQL_LETZTE_BUCHUNG).fetchone()[0]
+    daten = _snapshot_json(get_company_stats(pool, None, nur_arbeitstage, feiertage))
+    with pool.transaktion() as conn:
+        snapshot_id = conn.execute(SQL_SNAPSHOT_NEU, (epoch(datetime.now().replace(microsecond=0)), letzte_buchung, daten)).lastrowid
+        conn.execute("DELETE FROM kpi_snapshot WHERE id <= ?", (snapshot_id - KPI_SNAPSHOTS_BEHALTEN,))
+    return snapshot_id
+
+def letzter_kpi_snapshot(pool):
+    """(id, erstellt als datetime, letzte_buchung) des neuesten Snapshots oder None."""
+    with pool.verbindung() as conn:
+        zeile = conn.execute(SQL_SNAPSHOT_LETZTER).fetchone()
+    if zeile is None:
+        return None
+    return zeile[0], _als_datetime(zeile[1]), zeile[2]
+
+def aktueller_kpi_snapshot(pool, nur_arbeitstage=False, feiertage=()):
+    """id des neuesten Snapshots; gibt es noch keinen, wird der erste jetzt berechnet."""
+    letzter = letzter_kpi_snapshot(pool)
+    return letzter[0] if letzter else kpi_snapshot_erstellen(pool, nur_arbeitstage, feiertage)
+
+def kpi_snapshot_laden(pool, snapshot_id):
+    """(erstellt, Kennzahlen) eines Snapshots; Kennzahlen wie get_company_stats."""
+    with pool.verbindung() as conn:
+        erstellt, daten = conn.execute(SQL_SNAPSHOT_DATEN, (snapshot_id,)).fetchone()
+    return _als_datetime(erstellt), _snapshot_laden(daten)
+
+def neue_buchungen_seit(pool, buchung_id):
+    with pool.verbindung() as conn:
+        return conn.execute(SQL_NEUE_BUCHUNGEN, (buchung_id,)).fetchone()[0]
+
+
+# --- SCHREIBEN ---
+
+def _buchungen_schreiben(conn, buchungen):
+    """Fügt (user_id, projekt, aktion, zeit)-Tupel ein und aktualisiert tagessaldo je Mitarbeiter und Tag."""
+    conn.executemany(SQL_BUCHUNG_NEU, [(user_id, projekt, aktion, epoch(zeit)) for user_id, projekt, aktion, zeit in buchungen])
+    tage = {}
+    for user_id, _, _, zeit in buchungen:
+        tage.setdefault(user_id, set()).add(str(zeit)[:10])
+    tagessalden_aktualisieren(conn, tage)
+
+def buchung_speichern(pool, user_id, projekt, aktion, zeit):
+    """zeit: datetime oder 'YYYY-MM-DD HH:MM:SS'."""
+    with pool.transaktion() as conn:
+        _buchungen_schreiben(conn, [(user_id, projekt, aktion, zeit)])
+
+
+class BuchungsWarteschlange:
+    """Sammelt Stempel aller Sessions und schreibt sie gebündelt (Group Commit).
+
+    Ein Schreib-Thread nimmt den ersten Stempel aus der Queue, wartet höchstens
+    `max_wartezeit` Sekunden auf weitere (bis `max_batch`) und schreibt alle in einer
+    Transaktion mit eigener Verbindung und synchronous=FULL: ein fsync pro Block.
+    Das Future eines Stempels wird erst nach dem Commit erfüllt. schliessen() (auch
+    per atexit) schreibt alle bereits eingereihten Stempel, bevor der Thread endet.
+    Bricht der Schreib-Thread ab (z.B. weil die Datenbank nicht zu öffnen ist), schlagen
+    alle noch eingereihten Stempel mit dem Fehler fehl und die Warteschlange ist geschlossen.
+    """
+
+    def __init__(self, db_name, max_wartezeit=0.005, max_batch=500):
+        self.db_name = db_name
+        self.max_wartezeit = max_wartezeit
+        self.max_batch = max_batch
+        self.bloecke = 0
+        self.stempel = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._geschlossen = False
+        self._fehler = None
+        self._thread = threading.Thread(target=self._schreiben, name="buchungs-warteschlange", daemon=True)
+        self._thread.start()
+        atexit.register(self.schliessen)
+
+    @property
+    def offen(self):
+        """False, sobald geschlossen oder der Schreib-Thread beendet ist."""
+        return not self._geschlossen and self._thread.is_alive()
+
+    def einreihen(self, user_id, projekt, aktion, zeit):
+        """Reiht einen Stempel ein; das Future liefert True nach dem Commit oder die Exception."""
+        future = Future()
+        with self._lock:
+            if not self.offen:
+                raise RuntimeError("Buchungs-Warteschlange ist geschlossen") from self._fehler
+            self._queue.put((user_id, projekt, aktion, zeit, future))
+        return future
+
+    def speichern(self, user_id, projekt, aktion, zeit, timeout=30):
+        """Wie buchung_speichern: kehrt erst zurück, wenn der Stempel dauerhaft gespeichert ist.
+
+        TimeoutError heißt nur, dass der Commit noch aussteht: der Stempel bleibt eingereiht und
+        kann danach noch gespeichert werden. Ihn erneut zu speichern, ergäbe eine doppelte Buchung.
+        """
+        return self.einreihen(user_id, projekt, aktion, zeit).result(timeout)
+
+    def schliessen(self):
+        with self._lock:
+            if self._geschlossen:
+                return
+            self._geschlossen = True
+            # Markiert das Ende: alles davor Eingereihte wird noch geschrieben
+            self._queue.put(None)
+        self._thread.join()
+
+    def _schreiben(self):
+        conn = None
+        block = []
+        try:
+            conn = verbinden(self.db_name, synchronous='FULL')
+            ende = False
+            while not ende:
+                eintrag = self._queue.get()
+                if eintrag is None:
+                    return
+                block = [eintrag]
+                frist = time.monotonic() + self.max_wartezeit
+                while len(block) < self.max_batch:
+                    try:
+                        eintrag = self._queue.get(timeout=max(frist - time.monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    if eintrag is None:
+                        ende = True
+                        break
+                    block.append(eintrag)
+                self._block_schreiben(conn, block)
+        except BaseException as e:
+            self._fehler = e
+            raise
+        finally:
+            self._abbrechen(block)
+            if conn is not None:
+                conn.close()
+
+    def _abbrechen(self, block):
+        # Nach dem Ende des Threads nimmt niemand mehr Stempel an; Wartende (auch aus einem
+        # abgebrochenen Block) bekommen den Fehler statt eines Timeouts
+        with self._lock:
+            self._geschlossen = True
+        offen = list(block)
+        while True:
+            try:
+                offen.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        fehler = RuntimeError("Buchungs-Warteschlange ist geschlossen")
+        fehler.__cause__ = self._fehler
+        for eintrag in offen:
+            if eintrag is not None and not eintrag[4].done():
+                eintrag[4].set_exception(fehler)
+
+    def _transaktion(self, conn, block):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _buchungen_schreiben(conn, [eintrag[:4] for eintrag in block])
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _block_schreiben(self, conn, block):
+        try:
+            self._transaktion(conn, block)
+        except Exception:
+            # Einzeln wiederholen, damit ein fehlerhafter Stempel nicht den ganzen Block verwirft
+            for eintrag in block:
+                try:
+                    self._transaktion(conn, [eintrag])
+                except Exception as e:
+                    eintrag[4].set_exception(e)
+                else:
+                    eintrag[4].set_result(True)
+        else:
+            for eintrag in block:
+                eintrag[4].set_result(True)
+        self.bloecke += 1
+        self.stempel += len(block)
+
+def urlaub_beantragen(pool, user_id, start, ende, typ, kommentar):
+    with pool.transaktion() as conn:
+        conn.execute(SQL_ANTRAG_NEU, (user_id, str(start), str(ende), typ, kommentar))
+
+def antraege_entscheiden(pool, entscheidungen):
+    """Setzt Status und Notiz für viele Anträge in einer Transaktion.
+
+    entscheidungen: Liste von (id, status, notiz). Gibt die user_ids der betroffenen Mitarbeiter zurück.
+    """
+    zeilen = [(status, notiz, int(id_val)) for id_val, status, notiz in entscheidungen]
+    ids = [zeile[2] for zeile in zeilen]
+    user_ids = set()
+    with pool.transaktion() as conn:
+        # SQLite begrenzt die Zahl der Parameter pro Statement
+        for i in range(0, len(ids), 500):
+            teil = ids[i:i + 500]
+            platzhalter = ",".join("?" * len(teil))
+            user_ids.update(z[0] for z in conn.execute(f"SELECT DISTINCT user_id FROM abwesenheiten WHERE id IN ({platzhalter})", teil))
+        conn.executemany(SQL_ANTRAG_ENTSCHEIDEN, zeilen)
+    return user_ids
+
+
+def user_ids_fuer_namen(conn, namen):
+    """Ordnet Namen (z.B. aus Altsystemen) user_ids zu; unbekannte Namen werden als inaktive Benutzer angelegt."""
+    ids = {name: user_id for name, user_id in conn.execute("SELECT full_name, MIN(id) FROM users WHERE full_name IS NOT NULL GROUP BY full_name")
+           if name in namen}
+    for name in sorted(set(namen) - set(ids)):
+        cur = conn.execute("INSERT INTO users (username, role, full_name) VALUES ('inaktiv_' || lower(hex(randomblob(6))), 'inaktiv', ?)", (name,))
+        ids[name] = cur.lastrowid
+    return ids
@@ -0,0 +1,73 @@
+"""Hintergrund-Aktualisierung der Cockpit-Kennzahlen (ohne Streamlit-Abhängigkeit).
+
+Ein Thread pro Prozess prüft alle PRUEF_SEKUNDEN, ob der letzte KPI-Snapshot
+älter als `intervall` Sekunden ist oder seitdem `nach_buchungen` neue Stempel
+hinzugekommen sind, und legt dann einen neuen Snapshot an. anstossen() erzwingt
+eine Aktualisierung beim nächsten Durchlauf (z.B. nach genehmigten Anträgen).
+"""
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+import db
+
+PRUEF_SEKUNDEN = 5
+
+
+class KpiAktualisierer(threading.Thread):
+
+    def __init__(self, pool, intervall=300, nach_buchungen=50, nur_arbeitstage=False, feiertage=()):
+        super().__init__(name="kpi-aktualisierer", daemon=True)
+        self.pool = pool
+        self.intervall = intervall
+        self.nach_buchungen = nach_buchungen
+        self.nur_arbeitstage = nur_arbeitstage
+        self.feiertage = feiertage
+        self.laeufe = 0
+        self.letzte_dauer = None
+        self._angestossen = threading.Event()
+        self._stopp = threading.Event()
+
+    def faellig(self):
+        """Grund für eine Aktualisierung ('kein Snapshot', 'Intervall', 'Buchungen') oder None."""
+        letzter = db.letzter_kpi_snapshot(self.pool)
+        if letzter is None:
+            return 'kein Snapshot'
+        _, erstellt, letzte_buchung = letzter
+        if (datetime.now() - erstellt).total_seconds() >= self.intervall:
+            return 'Intervall'
+        if db.neue_buchungen_seit(self.pool, letzte_buchung) >= self.nach_buchungen:
+            return 'Buchungen'
+        return None
+
+    def aktualisieren(self):
+        t0 = time.perf_counter()
+        snapshot_id = db.kpi_snapshot_erstellen(self.pool, self.nur_arbeitstage, self.feiertage)
+        self.letzte_dauer = time.perf_counter() - t0
+        self.laeufe += 1
+        return snapshot_id
+
+    def anstossen(self):
+        self._angestossen.set()
+
+    def stoppen(self, warten=True):
+        self._stopp.set()
+        self._angestossen.set()
+        if warten and self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self._stopp.is_set():
+            angestossen = self._angestossen.wait(PRUEF_SEKUNDEN)
+            self._angestossen.clear()
+            if self._stopp.is_set():
+                return
+            try:
+                if angestossen or self.faellig():
+                    self.aktualisieren()
+            except Exception:
+                # Der Thread soll weiterlaufen; der nächste Durchlauf versucht es erneut
+                print("KPI-Aktualisierung fehlgeschlagen:", file=sys.stderr)
+                traceback.print_exc()
@@ -0,0 +1,310 @@
+"""Zeitmessung der Reruns: Helfer, SQL-Abfragen, pandas und UI-Abschnitte (ohne Streamlit-Abhängigkeit).
+
+Gemessen wird nur innerhalb eines laufenden Reruns (with lauf(...)). Außerhalb,
+z.B. in cli.py, kosten die Messpunkte nur eine Abfrage auf threading.local.
+Jedes Ereignis kennt seine Gesamtdauer und seine eigene Zeit ohne verschachtelte
+Messungen, damit sich die Aufteilung pro Art zur Rerun-Dauer aufsummiert.
+"""
+import cProfile
+import functools
+import io
+import json
+import marshal
+import pstats
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+LETZTE_LAEUFE = 50
+SQL_NAME_LAENGE = 120
+
+_lokal = threading.local()
+# cProfile kann prozessweit nur einmal gleichzeitig aktiv sein
+_profil_sperre = threading.Lock()
+
+
+class Lauf:
+    """Messwerte eines Reruns."""
+
+    def __init__(self, seite, benutzer):
+        self.seite = seite
+        self.benutzer = benutzer
+        self.start = datetime.now()
+        self.dauer = 0.0
+        self.ereignisse = []
+        self.profil = None
+        self._t0 = time.perf_counter()
+        self._stapel = []
+
+    def summen(self):
+        """Eigene Zeit pro Art; der Rest bis zur Rerun-Dauer ist 'sonstiges'."""
+        summen = {}
+        for e in self.ereignisse:
+            summen[e['art']] = summen.get(e['art'], 0.0) + e['eigen']
+        summen['sonstiges'] = max(self.dauer - sum(summen.values()), 0.0)
+        return summen
+
+    def als_dict(self):
+        return {
+            'zeit': self.start.isoformat(timespec='seconds'),
+            'seite': self.seite,
+            'benutzer': self.benutzer,
+            'dauer_ms': round(self.dauer * 1000, 3),
+            'summen_ms': {art: round(s * 1000, 3) for art, s in self.summen().items()},
+            'ereignisse': [{'art': e['art'], 'name': e['name'], 'tiefe': e['tiefe'],
+                            'dauer_ms': round(e['dauer'] * 1000, 3), 'eigen_ms': round(e['eigen'] * 1000, 3),
+                            'zeilen': e['zeilen'], **({'cache': e['cache']} if 'cache' in e else {})}
+                           for e in self.ereignisse],
+        }
+
+
+def aktiv():
+    return getattr(_lokal, 'lauf', None)
+
+
+def _ereignis(lauf, art, name):
+    e = {'art': art, 'name': name, 'dauer': 0.0, 'eigen': 0.0, 'kinder': 0.0, 'zeilen': None, 'tiefe': len(lauf._stapel)}
+    lauf.ereignisse.append(e)
+    return e
+
+
+def _zeit_nach_oben(lauf, dauer):
+    # Verschachtelte Zeit beim direkten Eltern-Ereignis abziehen
+    if lauf._stapel:
+        lauf._stapel[-1]['kinder'] += dauer
+
+
+@contextmanager
+def messen(art, name):
+    """Misst einen Abschnitt; das gelieferte Ereignis-dict nimmt 'zeilen' auf (außerhalb eines Laufs: {})."""
+    lauf = aktiv()
+    if lauf is None:
+        yield {}
+        return
+    e = _ereignis(lauf, art, name)
+    lauf._stapel.append(e)
+    t0 = time.perf_counter()
+    try:
+        yield e
+    finally:
+        e['dauer'] = time.perf_counter() - t0
+        e['eigen'] = max(e['dauer'] - e.pop('kinder'), 0.0)
+        lauf._stapel.pop()
+        _zeit_nach_oben(lauf, e['dauer'])
+
+
+def ereignis():
+    """Das gerade offene Ereignis (z.B. um einen Cache-Fehlgriff zu vermerken) oder ein leeres dict."""
+    lauf = aktiv()
+    return lauf._stapel[-1] if lauf is not None and lauf._stapel else {}
+
+
+def zeilen_von(ergebnis):
+    """Zeilenzahl eines Ergebnisses: DataFrame/Series/Liste direkt, bei Tupeln das erste Element mit Länge."""
+    if isinstance(ergebnis, tuple):
+        ergebnis = next((x for x in ergebnis if hasattr(x, '__len__') and not isinstance(x, str)), None)
+    if ergebnis is None or isinstance(ergebnis, (str, dict)) or not hasattr(ergebnis, '__len__'):
+        return None
+    return len(ergebnis)
+
+
+def gemessen(art='helfer', name=None):
+    """Dekorator: misst jeden Aufruf innerhalb eines Laufs samt Zeilenzahl des Ergebnisses."""
+    def deko(fn):
+        ereignis_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def aufruf(*args, **kwargs):
+            if aktiv() is None:
+                return fn(*args, **kwargs)
+            with messen(art, ereignis_name) as e:
+                ergebnis = fn(*args, **kwargs)
+                e['zeilen'] = zeilen_von(ergebnis)
+            return ergebnis
+        return aufruf
+    return deko
+
+
+def sql_name(sql):
+    """Kurzform eines SQL-Texts als Name in Log und Metriken."""
+    name = " ".join(sql.split())
+    return name if len(name) <= SQL_NAME_LAENGE else name[:SQL_NAME_LAENGE - 1] + "…"
+
+
+# --- SQL ---
+# Cursor, der Ausführung und Abholen der Zeilen einer Abfrage in einem Ereignis zusammenfasst.
+
+class MessCursor(sqlite3.Cursor):
+
+    def _abschnitt(self, fn, *args):
+        lauf, e = aktiv(), getattr(self, '_e', None)
+        if lauf is None or e is None:
+            return fn(*args)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            dauer = time.perf_counter() - t0
+            e['dauer'] += dauer
+            e['eigen'] += dauer
+            _zeit_nach_oben(lauf, dauer)
+
+    def _zeilen(self, anzahl):
+        e = getattr(self, '_e', None)
+        if e is not None:
+            e['zeilen'] = (e['zeilen'] or 0) + anzahl
+
+    def execute(self, sql, params=()):
+        lauf = aktiv()
+        self._e = None if lauf is None else _ereignis(lauf, 'sql', sql_name(sql))
+        if self._e is not None:
+            self._e.pop('kinder')
+            self._e['zeilen'] = 0
+        return self._abschnitt(super().execute, sql, params)
+
+    def executemany(self, sql, params):
+        lauf = aktiv()
+        self._e = None if lauf is None else _ereignis(lauf, 'sql', sql_name(sql))
+        if self._e is not None:
+            self._e.pop('kinder')
+        ergebnis = self._abschnitt(super().executemany, sql, params)
+        if self._e is not None:
+            self._e['zeilen'] = self.rowcount
+        return ergebnis
+
+    def fetchone(self):
+        zeile = self._abschnitt(super().fetchone)
+        self._zeilen(zeile is not None)
+        return zeile
+
+    def fetchmany(self, *args):
+        zeilen = self._abschnitt(super().fetchmany, *args)
+        self._zeilen(len(zeilen))
+        return zeilen
+
+    def fetchall(self):
+        zeilen = self._abschnitt(super().fetchall)
+        self._zeilen(len(zeilen))
+        return zeilen
+
+    def __next__(self):
+        zeile = self._abschnitt(super().__next__)
+        self._zeilen(1)
+        return zeile
+
+
+class MessVerbindung(sqlite3.Connection):
+    """Verbindung, deren Cursor gemessen werden (Connection.execute nutzt cursor() nicht von selbst)."""
+
+    def cursor(self, factory=MessCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+
+# --- SAMMELN ---
+
+class Speicher:
+    """Prozessweite Summen, die letzten Läufe und Kennzahlen pro SQL-Abfrage."""
+
+    def __init__(self, letzte=LETZTE_LAEUFE):
+        self.lock = threading.Lock()
+        self.laeufe = deque(maxlen=letzte)
+        self.reruns = {}
+        self.summen = {}
+        self.abfragen = {}
+
+    def aufnehmen(self, lauf):
+        with self.lock:
+            self.laeufe.append(lauf)
+            anzahl, sekunden = self.reruns.get(lauf.seite, (0, 0.0))
+            self.reruns[lauf.seite] = (anzahl + 1, sekunden + lauf.dauer)
+            for e in lauf.ereignisse:
+                schluessel = (e['art'], e['name'])
+                anzahl, sekunden, zeilen = self.summen.get(schluessel, (0, 0.0, 0))
+                self.summen[schluessel] = (anzahl + 1, sekunden + e['eigen'], zeilen + (e['zeilen'] or 0))
+                if e['art'] == 'sql':
+                    anzahl, sekunden, maximum, zeilen = self.abfragen.get(e['name'], (0, 0.0, 0.0, 0))
+                    self.abfragen[e['name']] = (anzahl + 1, sekunden + e['dauer'], max(maximum, e['dauer']), zeilen + (e['zeilen'] or 0))
+
+    def letzte_laeufe(self):
+        with self.lock:
+            return list(self.laeufe)
+
+    def langsamste_abfragen(self, n=20):
+        """Abfragen nach längster Einzeldauer."""
+        with self.lock:
+            abfragen = list(self.abfragen.items())
+        abfragen.sort(key=lambda a: a[1][2], reverse=True)
+        return [{'sql': sql, 'anzahl': anzahl, 'max_ms': maximum * 1000, 'mittel_ms': sekunden / anzahl * 1000,
+                 'zeilen_mittel': zeilen / anzahl}
+                for sql, (anzahl, sekunden, maximum, zeilen) in abfragen[:n]]
+
+    def metriken_text(self):
+        """Summen im Prometheus-Textformat."""
+        with self.lock:
+            reruns, summen = dict(self.reruns), dict(self.summen)
+
+        def label(wert):
+            return str(wert).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+        zeilen = ["# TYPE zeiterfassung_rerun_seconds summary"]
+        for seite, (anzahl, sekunden) in sorted(reruns.items()):
+            zeilen.append(f'zeiterfassung_rerun_seconds_sum{{seite="{label(seite)}"}} {sekunden:.6f}')
+            zeilen.append(f'zeiterfassung_rerun_seconds_count{{seite="{label(seite)}"}} {anzahl}')
+        zeilen += ["# TYPE zeiterfassung_messung_seconds_total counter",
+                   "# TYPE zeiterfassung_messung_total counter",
+                   "# TYPE zeiterfassung_messung_zeilen_total counter"]
+        for (art, name), (anzahl, sekunden, anzahl_zeilen) in sorted(summen.items()):
+            labels = f'art="{label(art)}",name="{label(name)}"'
+            zeilen.append(f'zeiterfassung_messung_seconds_total{{{labels}}} {sekunden:.6f}')
+            zeilen.append(f'zeiterfassung_messung_total{{{labels}}} {anzahl}')
+            zeilen.append(f'zeiterfassung_messung_zeilen_total{{{labels}}} {anzahl_zeilen}')
+        return "\n".join(zeilen) + "\n"
+
+
+SPEICHER = Speicher()
+_log_sperre = threading.Lock()
+
+
+def log_schreiben(lauf, datei):
+    """Hängt den Lauf als eine JSON-Zeile an die Log-Datei an."""
+    zeile = json.dumps(lauf.als_dict(), ensure_ascii=False)
+    with _log_sperre, open(datei, 'a', encoding='utf-8') as f:
+        f.write(zeile + "\n")
+
+
+def _profil_auswerten(profiler, lauf):
+    profiler.create_stats()
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(40)
+    # .prof-Inhalt wie von dump_stats, lesbar mit pstats/snakeviz
+    lauf.profil = {'text': text.getvalue(), 'prof': marshal.dumps(profiler.stats)}
+
+
+@contextmanager
+def lauf(seite, benutzer=None, log_datei=None, profil=False):
+    """Misst einen Rerun; mit profil=True zusätzlich per cProfile (falls kein anderer Lauf profiliert)."""
+    aktueller = Lauf(seite, benutzer)
+    _lokal.lauf = aktueller
+    profiler = cProfile.Profile() if profil and _profil_sperre.acquire(blocking=False) else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield aktueller
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _profil_sperre.release()
+            _profil_auswerten(profiler, aktueller)
+        aktueller.dauer = time.perf_counter() - aktueller._t0
+        _lokal.lauf = None
+        SPEICHER.aufnehmen(aktueller)
+        if log_datei:
+            log_schreiben(aktueller, log_datei)
@@ -0,0 +1,155 @@
+"""Synthetische Firmen für Benchmarks und Lasttests (ohne Streamlit-Abhängigkeit).
+
+firma_anlegen() füllt eine Datenbank ohne Benutzer mit Mitarbeitern pro Abteilung,
+Kommen/Pause/Gehen-Stempeln über mehrere Jahre und Abwesenheiten (Urlaubsblöcke,
+Krankheitsphasen, offene Anträge). Gleicher seed ergibt dieselbe Firma.
+
+    with temporaere_firma(abteilungen_verteilen(500), jahre=2) as (pool, info):
+        ...
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+
+import db
+from auswertung import TYP_KRANK, TYP_URLAUB
+
+ABTEILUNGEN = {'IT': 0.3, 'Vertrieb': 0.2, 'Produktion': 0.25, 'Marketing': 0.15, 'HR': 0.1}
+PROJEKTE = ['Web', 'Video', 'Intern']
+URLAUBSANSPRUCH = [25, 28, 30]
+VORNAMEN = ['Anna', 'Ben', 'Clara', 'David', 'Elif', 'Felix', 'Greta', 'Hannes', 'Ida', 'Jonas',
+            'Katrin', 'Lukas', 'Mia', 'Noah', 'Olga', 'Paul', 'Rosa', 'Stefan', 'Tara', 'Yusuf']
+NACHNAMEN = ['Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker',
+             'Schulz', 'Hoffmann', 'Koch', 'Richter', 'Klein', 'Wolf', 'Neumann', 'Yilmaz']
+
+STUNDE = 3600
+
+
+def abteilungen_verteilen(mitarbeiter, anteile=ABTEILUNGEN):
+    """Teilt eine Gesamtzahl Mitarbeiter nach Anteilen auf: {'IT': 30, ...}; jede Abteilung bekommt mindestens einen."""
+    namen = list(anteile)
+    anzahl = {name: max(1, int(mitarbeiter * anteile[name])) for name in namen}
+    anzahl[namen[0]] += max(0, mitarbeiter - sum(anzahl.values()))
+    return anzahl
+
+
+def _users(rng, abteilungen):
+    users = []
+    for abteilung, anzahl in abteilungen.items():
+        for i in range(1, anzahl + 1):
+            name = f"{rng.choice(VORNAMEN)} {rng.choice(NACHNAMEN)}"
+            users.append((f"{abteilung.lower()}.{i:05d}", '1234', 'user', name, abteilung,
+                          f"Mitarbeiter {abteilung}", int(rng.choice(URLAUBSANSPRUCH))))
+    return users
+
+
+def _frei(abwesend, u, von, bis):
+    return not abwesend[u, von:bis + 1].any()
+
+
+def _abwesenheiten(rng, tage, werktage, anspruch, jahre, krank_quote, offene_antraege):
+    """(Matrix Mitarbeiter x Tag mit True für abwesend, Zeilen für abwesenheiten mit Index statt user_id)."""
+    abwesend = np.zeros((len(anspruch), len(tage)), dtype=bool)
+    zeilen = []
+
+    def eintragen(u, von, bis, typ, kommentar, status):
+        abwesend[u, von:bis + 1] = True
+        zeilen.append((u, str(tage[von]), str(tage[bis]), typ, kommentar, status))
+
+    # Urlaub: pro Jahr Blöcke von 5 oder 10 Arbeitstagen, bis der Anspruch in Kalendertagen
+    # (so zählt abwesenheitstage ohne nur_arbeitstage) aufgebraucht ist
+    pro_jahr = len(werktage) // jahre
+    for u, tage_anspruch in enumerate(anspruch):
+        for jahr in range(jahre):
+            bereich = werktage[jahr * pro_jahr:(jahr + 1) * pro_jahr]
+            rest = tage_anspruch
+            while rest >= 5:
+                laenge = int(rng.choice([5, 10])) if rest >= 10 else 5
+                start = int(rng.integers(0, len(bereich) - laenge))
+                von, bis = bereich[start], bereich[start + laenge - 1]
+                if bis - von + 1 > rest:
+                    break
+                if _frei(abwesend, u, von, bis):
+                    eintragen(u, von, bis, TYP_URLAUB, "Urlaub", 'Genehmigt')
+                rest -= bis - von + 1
+
+    # Krankheit: an krank_quote der Arbeitstage beginnt eine Phase von 1-5 Kalendertagen
+    for u, start in np.argwhere(rng.random((len(anspruch), len(werktage))) < krank_quote):
+        von = werktage[start]
+        bis = min(von + int(rng.integers(0, 5)), len(tage) - 1)
+        if _frei(abwesend, u, von, bis):
+            eintragen(u, von, bis, TYP_KRANK, "", 'Genehmigt')
+
+    # Offene Urlaubsanträge in den nächsten Wochen (ohne Auswirkung auf die Stempel)
+    ende = tage[-1].astype(date)
+    for u in np.flatnonzero(rng.random(len(anspruch)) < offene_antraege):
+        start = ende + timedelta(days=int(rng.integers(7, 60)))
+        zeilen.append((int(u), str(start), str(start + timedelta(days=4)), TYP_URLAUB, "Bitte genehmigen", 'Ausstehend'))
+    return abwesend, zeilen
+
+
+def _stempel(rng, tage, anwesend, projekte, pause_quote):
+    """Kommen, optional Pause (Beginn und Ende) und Gehen für jeden anwesenden (Mitarbeiter, Tag), nach Zeit sortiert."""
+    u, d = np.nonzero(anwesend)
+    n = len(u)
+    tag = tage[d].astype('datetime64[s]').astype('int64')
+    kommen = tag + np.clip(rng.normal(8 * STUNDE, 0.75 * STUNDE, n), 6 * STUNDE, 10 * STUNDE).astype('int64')
+    arbeit = np.clip(rng.normal(8 * STUNDE, 0.75 * STUNDE, n), 4 * STUNDE, 11 * STUNDE).astype('int64')
+    pause = rng.random(n) < pause_quote
+    pause_beginn = kommen + rng.integers(int(3.5 * STUNDE), 5 * STUNDE, n)
+    pause_laenge = rng.integers(30, 61, n) * 60
+    gehen = kommen + arbeit + np.where(pause, pause_laenge, 0)
+
+    user = np.concatenate([u, u[pause], u[pause], u])
+    aktion = np.repeat(np.array(['Kommen', 'Pause', 'Pause', 'Gehen'], dtype=object), [n, pause.sum(), pause.sum(), n])
+    zeit = np.concatenate([kommen, pause_beginn[pause], (pause_beginn + pause_laenge)[pause], gehen])
+    ordnung = np.argsort(zeit, kind='stable')
+    return user[ordnung], projekte[user[ordnung]], aktion[ordnung], zeit[ordnung]
+
+
+def firma_anlegen(pool, abteilungen, jahre=1, bis=None, seed=42, pause_quote=0.8, krank_quote=0.01, offene_antraege=0.1):
+    """Legt eine synthetische Firma an (Datenbank muss ohne Benutzer sein) und gibt Zeilenzahlen zurück.
+
+    abteilungen: {'IT': 40, ...} Mitarbeiter pro Abteilung. Stempel gibt es an Werktagen der
+    `jahre` Jahre bis einschließlich `bis` (Standard: gestern), außer an Urlaubs- und Krankheitstagen.
+    """
+    db.init_db(pool)
+    if db.hat_benutzer(pool):
+        raise ValueError("firma_anlegen braucht eine Datenbank ohne Benutzer")
+    rng = np.random.default_rng(seed)
+    ende = np.datetime64(bis or date.today() - timedelta(days=1), 'D')
+    tage = np.arange(ende - np.timedelta64(365 * jahre - 1, 'D'), ende + 1)
+    ist_werktag = np.is_busday(tage)
+    werktage = np.flatnonzero(ist_werktag)
+
+    users = _users(rng, abteilungen)
+    anspruch = [zeile[6] for zeile in users]
+    abwesend, abwesenheiten = _abwesenheiten(rng, tage, werktage, anspruch, jahre, krank_quote, offene_antraege)
+    projekte = np.array(PROJEKTE, dtype=object)[rng.integers(0, len(PROJEKTE), len(users))]
+    user, projekt, aktion, zeit = _stempel(rng, tage, ist_werktag & ~abwesend, projekte, pause_quote)
+
+    with pool.transaktion() as conn:
+        conn.execute("INSERT INTO users (username, password, role, full_name, department, job_title, vacation_days_total) VALUES ('admin', 'admin123', 'admin', 'Personalabteilung (HR)', 'HR', 'Head of HR', 30)")
+        conn.executemany("INSERT INTO users (username, password, role, full_name, department, job_title, vacation_days_total) VALUES (?,?,?,?,?,?,?)", users)
+        ids = dict(conn.execute("SELECT username, id FROM users"))
+        user_ids = np.array([ids[zeile[0]] for zeile in users], dtype='int64')
+        conn.executemany(db.SQL_BUCHUNG_NEU, zip(user_ids[user].tolist(), projekt.tolist(), aktion.tolist(), zeit.tolist()))
+        conn.executemany("INSERT INTO abwesenheiten (user_id, start_datum, end_datum, typ, kommentar, status) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(int(user_ids[u]), *rest) for u, *rest in abwesenheiten])
+        tagessalden = db.tagessaldo_neu_aufbauen(conn)
+    return {'mitarbeiter': len(users), 'tage': len(tage), 'buchungen': len(zeit),
+            'abwesenheiten': len(abwesenheiten), 'tagessalden': tagessalden}
+
+
+@contextmanager
+def temporaere_firma(abteilungen, **optionen):
+    """firma_anlegen in einer temporären Datenbank; liefert (pool, Zeilenzahlen) und löscht sie danach."""
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = db.VerbindungsPool(os.path.join(tmp, 'firma.db'))
+        try:
+            yield pool, firma_anlegen(pool, abteilungen, **optionen)
+        finally:
+            pool.schliessen()
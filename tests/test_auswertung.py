@@ -0,0 +1,20 @@
+import pandas as pd
+
+from auswertung import berechne_kpis
+from benchmark import berechne_kpis_alt, synthetische_buchungen
+
+
+def test_berechne_kpis_wie_bisherige_implementierung():
+    # Ohne Pausen müssen alte Schleife und vektorisierte Berechnung gleich rechnen
+    df = synthetische_buchungen(4_000, n_mitarbeiter=50)
+    stats_alt, saldo_alt = berechne_kpis_alt(df, 'all')
+    stats_neu, saldo_neu = berechne_kpis(df, 'all')
+    pd.testing.assert_frame_equal(stats_alt, stats_neu, check_dtype=False, atol=0.011)
+    assert abs(saldo_alt - saldo_neu) < 0.05, (saldo_alt, saldo_neu)
+
+
+def test_berechne_kpis_zieht_pausen_ab():
+    # Gehen liegt 6,5-10,5 h nach Kommen, davon 30 Minuten Pause
+    stats, _ = berechne_kpis(synthetische_buchungen(20_000, n_mitarbeiter=50, pausen=True), 'all')
+    assert stats['Ist'].between(6 - 0.011, 10 + 0.011).all(), stats['Ist'].describe()
+
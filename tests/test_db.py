@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import db
+from auswertung import TYP_KRANK, TYP_URLAUB
+
+
+def test_hot_queries_nutzen_indizes(pool):
+    with pool.verbindung() as conn:
+        assert db.pruefe_query_plaene(conn) == {}
+
+
+# Stempelfolgen, bei denen die Schicht über Mitternacht oder MAX_SCHICHT_STUNDEN hinaus reicht
+TAGESSALDO_FAELLE = {
+    'nachtschicht': [('Kommen', '2025-03-07 22:00:00'), ('Pause', '2025-03-08 02:00:00'),
+                     ('Pause', '2025-03-08 02:30:00'), ('Gehen', '2025-03-08 06:30:00')],
+    'geteilte schicht': [('Kommen', '2025-03-10 06:00:00'), ('Gehen', '2025-03-10 10:00:00'),
+                         ('Kommen', '2025-03-10 17:00:00'), ('Gehen', '2025-03-11 01:00:00')],
+    'gehen vergessen': [('Kommen', '2025-03-07 08:00:00'), ('Gehen', '2025-03-10 17:00:00')],
+    'zwei tage offen': [('Kommen', '2025-03-10 08:00:00'), ('Gehen', '2025-03-12 17:00:00')],
+    'knapp unter grenze': [('Kommen', '2025-03-10 20:00:00'), ('Gehen', '2025-03-11 19:00:00'),
+                           ('Kommen', '2025-03-11 22:00:00'), ('Gehen', '2025-03-12 06:00:00')],
+}
+ALLE_STEMPEL = [s for stempel in TAGESSALDO_FAELLE.values() for s in stempel]
+# Nachträge: dieselben Stempel in zufälliger Reihenfolge gespeichert
+for nr in range(10):
+    TAGESSALDO_FAELLE[f'mischung {nr + 1}'] = [ALLE_STEMPEL[j] for j in np.random.default_rng(nr).permutation(len(ALLE_STEMPEL))]
+
+
+@pytest.mark.parametrize('stempel', TAGESSALDO_FAELLE.values(), ids=TAGESSALDO_FAELLE.keys())
+def test_tagessaldo_pro_stempel_wie_neuaufbau(pool, stempel):
+    sql = "SELECT user_id, datum, kommen, gehen, ist, saldo FROM tagessaldo ORDER BY user_id, datum"
+    with pool.transaktion() as conn:
+        conn.execute("INSERT INTO users (username, password, role, full_name) VALUES ('test', '', 'user', 'Test')")
+    for aktion, zeit in stempel:
+        db.buchung_speichern(pool, 1, 'Web', aktion, zeit)
+    with pool.verbindung() as conn:
+        einzeln = conn.execute(sql).fetchall()
+    with pool.transaktion() as conn:
+        db.tagessaldo_neu_aufbauen(conn)
+    with pool.verbindung() as conn:
+        assert einzeln == conn.execute(sql).fetchall()
+
+
+def test_urlaub_und_krankheit_eines_mitarbeiters(pool):
+    with pool.transaktion() as conn:
+        conn.execute("INSERT INTO users (username, password, role, full_name, vacation_days_total) VALUES ('test', '', 'user', 'Test', 30)")
+        conn.executemany("INSERT INTO abwesenheiten (user_id, start_datum, end_datum, typ, kommentar, status) VALUES (1, ?, ?, ?, '', ?)", [
+            ('2025-03-10', '2025-03-14', TYP_URLAUB, 'Genehmigt'),
+            ('2025-04-07', '2025-04-08', TYP_URLAUB, 'Ausstehend'),
+            ('2025-05-05', '2025-05-06', TYP_KRANK, 'Genehmigt'),
+        ])
+    assert db.get_vacation_stats(pool, 1, 30) == (5, 25)
+    assert db.count_sick_days(pool, 1) == 2